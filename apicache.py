@@ -0,0 +1,252 @@
+# WikiTree - WikiTree Integration
+#
+# Copyright (C) 2021  Hans Boldt
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+"""
+Persistent on-disk cache of WikiTree API responses.
+"""
+
+#-------------------#
+# Python modules    #
+#-------------------#
+import json
+import sqlite3
+import threading
+import time
+
+
+# Time to live of cached responses, in seconds, per API action
+DEFAULT_TTL = 24 * 60 * 60
+ACTION_TTL = {
+    'getRelatives': 24 * 60 * 60,
+    'getBio': 24 * 60 * 60,
+    'getProfile': 24 * 60 * 60,
+    'getPeople': 24 * 60 * 60,
+    'searchPerson': 60 * 60,
+    }
+
+# Time to live of error responses (profile not found, limit exceeded...)
+ERROR_TTL = 10 * 60
+
+# Maximum total size of the cached responses, in bytes
+MAX_BYTES = 64 * 1024 * 1024
+
+# The access time of an entry, used for eviction, is only updated once
+# it is older than this many seconds, so most reads do not write
+ACCESS_RESOLUTION = 10 * 60
+
+# Changed when the table layout changes; the cache is then emptied
+SCHEMA_VERSION = 2
+
+# Parameters that do not change the response
+IGNORED_PARAMS = ('action', 'format')
+
+
+#====================================================
+#
+# Class ResponseCache
+#
+#====================================================
+
+class ResponseCache:
+    """
+    SQLite-backed cache of decoded API responses, keyed by action and
+    normalized parameters, with a time to live per action and least
+    recently used eviction beyond a maximum total size. Error responses
+    are kept for ERROR_TTL only.
+
+    In offline mode, entries are returned even after they expire.
+    """
+
+    def __init__(self, path, ttl=None, max_bytes=MAX_BYTES):
+        """
+        Open (or create) the cache in the given file.
+        """
+        self.path = path
+        self.ttl = dict(ACTION_TTL)
+        if ttl:
+            self.ttl.update(ttl)
+        self.max_bytes = max_bytes
+        self.offline = False
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        version = self._conn.execute('PRAGMA user_version').fetchone()[0]
+        if version != SCHEMA_VERSION:
+            self._conn.execute('DROP TABLE IF EXISTS responses')
+            self._conn.execute('PRAGMA user_version = %d' % SCHEMA_VERSION)
+        self._conn.execute('CREATE TABLE IF NOT EXISTS responses ('
+                           'key TEXT PRIMARY KEY, '
+                           'action TEXT, '
+                           'value TEXT, '
+                           'size INTEGER, '
+                           'ttl REAL, '
+                           'stored REAL, '
+                           'accessed REAL)')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS responses_accessed '
+                           'ON responses (accessed)')
+        self._conn.commit()
+        self.total_bytes = self._conn.execute(
+            'SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+
+
+    @staticmethod
+    def make_key(action, params):
+        """
+        Build the cache key for an action and its parameters.
+        """
+        norm = sorted((str(k), str(v).strip())
+                      for k, v in params.items()
+                      if k not in IGNORED_PARAMS)
+        return action + ':' + json.dumps(norm, separators=(',', ':'))
+
+
+    def get(self, action, params, allow_stale=False):
+        """
+        Return the cached response, or None if there is none. Expired
+        entries are only returned if allow_stale is set or the cache is
+        in offline mode.
+        """
+        key = self.make_key(action, params)
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT value, ttl, stored, accessed FROM responses '
+                'WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+
+            value, ttl, stored, accessed = row
+            if ttl is None:
+                ttl = self.ttl.get(action, DEFAULT_TTL)
+            fresh = now - stored < ttl
+            if not fresh and not (allow_stale or self.offline):
+                self.misses += 1
+                return None
+
+            if now - accessed >= ACCESS_RESOLUTION:
+                self._conn.execute(
+                    'UPDATE responses SET accessed = ? WHERE key = ?',
+                    (now, key))
+                self._conn.commit()
+            if fresh:
+                self.hits += 1
+            else:
+                self.stale_hits += 1
+        return json.loads(value)
+
+
+    def put(self, action, params, value):
+        """
+        Store a response, evicting the least recently used entries if
+        the cache is over its size limit. Error responses are stored
+        with a short time to live.
+        """
+        key = self.make_key(action, params)
+        text = json.dumps(value)
+        size = len(text.encode('utf-8'))
+        if size > self.max_bytes:
+            return
+        ttl = ERROR_TTL if is_error_response(value) else None
+        now = time.time()
+        with self._lock:
+            old = self._conn.execute(
+                'SELECT size FROM responses WHERE key = ?', (key,)).fetchone()
+            if old:
+                self.total_bytes -= old[0]
+            self._conn.execute(
+                'INSERT OR REPLACE INTO responses '
+                '(key, action, value, size, ttl, stored, accessed) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (key, action, text, size, ttl, now, now))
+            self.total_bytes += size
+            while self.total_bytes > self.max_bytes:
+                rows = self._conn.execute(
+                    'SELECT key, size FROM responses WHERE key != ? '
+                    'ORDER BY accessed LIMIT 100', (key,)).fetchall()
+                if not rows:
+                    break
+                for old_key, old_size in rows:
+                    if self.total_bytes <= self.max_bytes:
+                        break
+                    self._conn.execute('DELETE FROM responses WHERE key = ?',
+                                       (old_key,))
+                    self.total_bytes -= old_size
+            self._conn.commit()
+
+
+    def invalidate(self, action=None):
+        """
+        Remove all entries, or all entries for one action.
+        """
+        with self._lock:
+            if action:
+                self._conn.execute('DELETE FROM responses WHERE action = ?',
+                                   (action,))
+            else:
+                self._conn.execute('DELETE FROM responses')
+            self._conn.commit()
+            self.total_bytes = self._conn.execute(
+                'SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+
+
+    def stats(self):
+        """
+        Return hit/miss statistics.
+        """
+        with self._lock:
+            entries = self._conn.execute(
+                'SELECT COUNT(*) FROM responses').fetchone()[0]
+        lookups = self.hits + self.stale_hits + self.misses
+        return {'hits': self.hits,
+                'stale hits': self.stale_hits,
+                'misses': self.misses,
+                'hit rate': ((self.hits + self.stale_hits) / lookups
+                             if lookups else 0.0),
+                'entries': entries,
+                'bytes': self.total_bytes}
+
+
+    def close(self):
+        """
+        Close the cache file.
+        """
+        with self._lock:
+            self._conn.close()
+
+
+
+def is_error_response(value):
+    """
+    Return True if a WikiTree API response reports an error: a non-zero
+    status, or a requested profile that was not found.
+    """
+    if not isinstance(value, list):
+        return True
+    for entry in value:
+        if not isinstance(entry, dict):
+            continue
+        if entry.get('status') not in (None, 0, '', '0'):
+            return True
+        for item in entry.get('items') or ():
+            if isinstance(item, dict) and 'person' not in item:
+                return True
+    return False
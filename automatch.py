@@ -0,0 +1,334 @@
+# WikiTree - WikiTree Integration
+#
+# Copyright (C) 2021  Hans Boldt
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+"""
+Bulk search of WikiTree for people who have no WikiTree id yet.
+
+The job writes one JSON line per person searched to a review queue
+file, one file per family tree. People already in the queue file are
+skipped, so a job that was stopped resumes where it left off.
+"""
+
+#-------------------#
+# Python modules    #
+#-------------------#
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import hashlib
+import json
+import os
+import threading
+
+#-------------------#
+# Gramps modules    #
+#-------------------#
+from gramps.gen.lib import Person
+from gramps.gen.const import HOME_DIR
+from gramps.gen.utils.db import (get_birth_or_fallback,
+                                 get_death_or_fallback)
+
+# Other gramplet modules
+from services import build_search_details
+from wikitreeapi import RateLimiter, search_person
+from wtindex import WikiTreeIndex
+
+
+# Review queue file; %s is replaced by a digest of the family tree path
+QUEUE_PATH = os.path.join(HOME_DIR, 'wikitree_automatch_%s.jsonl')
+
+MAX_CONCURRENT = 4
+CALLS_PER_SECOND = 2.0
+SEARCH_LIMIT = 10
+
+# A candidate is applied without review if it scores at least
+# APPLY_SCORE, and APPLY_MARGIN more than the next best candidate
+APPLY_SCORE = 80
+APPLY_MARGIN = 20
+
+
+
+#====================================================
+#
+# Class AutoMatchJob
+#
+#====================================================
+
+class AutoMatchJob:
+    """
+    Search WikiTree for every person without a WikiTree id and queue
+    the scored candidates for review.
+    """
+
+    def __init__(self, db, queue_path=None, person_handles=None,
+                 use_dob=True, use_dod=True,
+                 max_concurrent=MAX_CONCURRENT,
+                 calls_per_second=CALLS_PER_SECOND):
+        """
+        Initialize job. If person_handles is None, all people in the
+        database are considered. The review queue of the family tree is
+        used unless queue_path is given.
+        """
+        self.db = db
+        self.queue_path = queue_path or get_queue_path(db)
+        self.person_handles = person_handles
+        self.use_dob = use_dob
+        self.use_dod = use_dod
+        self.max_concurrent = max_concurrent
+        self.limiter = RateLimiter(calls_per_second)
+
+        self.todo = list()
+        self.done_count = 0
+        self.errors = 0
+        self._cancelled = threading.Event()
+
+
+    def collect(self):
+        """
+        Generator, run on the main loop with run_in_idle: collect the
+        people still to be searched, and their search details, one
+        person per step. Returns the number of people to search.
+        """
+        processed = self.load_processed()
+        wt_index = WikiTreeIndex.for_db(self.db)
+        self.done_count = 0
+        self.todo = list()
+
+        if self.person_handles is None:
+            handles = list(self.db.iter_person_handles())
+        else:
+            handles = self.person_handles
+
+        for handle in handles:
+            if self._cancelled.is_set() or not self.db.is_open():
+                break
+            if handle in processed:
+                self.done_count += 1
+                continue
+            if wt_index.get_attributes(handle) \
+                    or not self.db.has_person_handle(handle):
+                continue
+            person = self.db.get_person_from_handle(handle)
+            self.todo.append({
+                'handle': handle,
+                'details': build_search_details(self.db, person,
+                                                self.use_dob, self.use_dod,
+                                                SEARCH_LIMIT),
+                'local': self.local_summary(person)})
+            yield
+        return len(self.todo)
+
+
+    def load_processed(self):
+        """
+        Return the handles of people already in the review queue.
+        """
+        processed = set()
+        if not os.path.exists(self.queue_path):
+            return processed
+        with open(self.queue_path, encoding='utf-8') as queue:
+            for line in queue:
+                try:
+                    processed.add(json.loads(line)['handle'])
+                except (ValueError, KeyError):
+                    # Partly written last line of an interrupted job
+                    continue
+        return processed
+
+
+    def local_summary(self, person):
+        """
+        Extract the facts used to score candidates.
+        """
+        name = person.get_primary_name()
+        gender = person.get_gender()
+        return {'first': name.get_first_name(),
+                'surname': name.get_surname(),
+                'gender': ('Male' if gender == Person.MALE
+                           else 'Female' if gender == Person.FEMALE
+                           else ''),
+                'birth': _event_year(get_birth_or_fallback(self.db, person)),
+                'death': _event_year(get_death_or_fallback(self.db, person))}
+
+
+    def cancel(self):
+        """
+        Stop the job after the searches in progress.
+        """
+        self._cancelled.set()
+
+
+    def run(self, progress=None):
+        """
+        Run the searches, with at most max_concurrent in flight, and
+        append the results to the review queue. progress(done, total)
+        is called after each person. Runs on a background thread.
+
+        Returns the number of people searched.
+        """
+        total = self.done_count + len(self.todo)
+        searched = 0
+        todo = iter(self.todo)
+        pending = set()
+
+        with ThreadPoolExecutor(max_workers=self.max_concurrent,
+                                thread_name_prefix='wikitree-match') as pool, \
+             open(self.queue_path, 'a', encoding='utf-8') as queue:
+
+            def fill():
+                while (len(pending) < self.max_concurrent
+                       and not self._cancelled.is_set()):
+                    entry = next(todo, None)
+                    if entry is None:
+                        return
+                    pending.add(pool.submit(self._search, entry))
+
+            fill()
+            while pending:
+                done, not_done = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    pending.discard(future)
+                    try:
+                        entry, candidates = future.result()
+                    except Exception:
+                        # Not written to the queue, so retried on resume
+                        self.errors += 1
+                        continue
+                    queue.write(json.dumps({
+                        'handle': entry['handle'],
+                        'details': entry['details'],
+                        'candidates': candidates}) + "\n")
+                    queue.flush()
+                    searched += 1
+                    self.done_count += 1
+                    if progress:
+                        progress(self.done_count, total)
+                fill()
+
+        return searched
+
+
+    def _search(self, entry):
+        """
+        Search for one person and score the candidates found.
+        """
+        self.limiter.wait()
+        results = search_person(entry['details'])
+        matches = (results[0].get('matches') or []) if results else []
+
+        candidates = list()
+        for match in matches:
+            if 'Name' not in match:
+                continue
+            candidates.append({
+                'id': match['Name'],
+                'name': match.get('LongNamePrivate') or match.get('LongName'),
+                'birth': match.get('BirthDate'),
+                'death': match.get('DeathDate'),
+                'score': score_candidate(entry['local'], match)})
+        candidates.sort(key=lambda c: c['score'], reverse=True)
+        return entry, candidates
+
+
+
+def get_queue_path(db):
+    """
+    Return the path of the review queue file for the family tree.
+    """
+    tree = hashlib.sha1(db.get_save_path().encode('utf-8')).hexdigest()
+    return QUEUE_PATH % tree[:16]
+
+
+def load_confident_matches(queue_path, min_score=APPLY_SCORE,
+                           min_margin=APPLY_MARGIN):
+    """
+    Return (handle, WikiTree id) for each person in the review queue
+    whose best candidate is good enough to be applied without review.
+    """
+    res = list()
+    if not os.path.exists(queue_path):
+        return res
+    with open(queue_path, encoding='utf-8') as queue:
+        for line in queue:
+            try:
+                entry = json.loads(line)
+                candidates = entry['candidates']
+            except (ValueError, KeyError):
+                continue
+            if not candidates or candidates[0]['score'] < min_score:
+                continue
+            if len(candidates) > 1 and \
+                    candidates[0]['score'] - candidates[1]['score'] < min_margin:
+                continue
+            res.append((entry['handle'], candidates[0]['id']))
+    return res
+
+
+def score_candidate(local, match):
+    """
+    Score how well a WikiTree search match fits a local person, from 0
+    (no resemblance) to 100.
+    """
+    score = 0
+
+    surname = local['surname'].strip().lower()
+    remote_surnames = {(match.get(k) or '').strip().lower()
+                       for k in ('LastNameAtBirth', 'LastNameCurrent')}
+    if surname and surname in remote_surnames:
+        score += 30
+
+    first = local['first'].strip().lower().split()
+    remote_first = (match.get('RealName') or match.get('FirstName')
+                    or '').strip().lower().split()
+    if first and remote_first:
+        if first[0] == remote_first[0]:
+            score += 20
+        elif first[0][:3] == remote_first[0][:3]:
+            score += 10
+
+    if local['gender'] and match.get('Gender'):
+        score += 10 if local['gender'] == match['Gender'] else -30
+
+    for key, remote_key in (('birth', 'BirthDate'), ('death', 'DeathDate')):
+        remote_year = _remote_year(match.get(remote_key))
+        if local[key] and remote_year:
+            diff = abs(local[key] - remote_year)
+            if diff == 0:
+                score += 20
+            elif diff <= 2:
+                score += 10
+            elif diff > 5:
+                score -= 20
+
+    return max(0, min(100, score))
+
+
+def _event_year(event):
+    """
+    Year of an event, or None if it is not known.
+    """
+    if not event:
+        return None
+    return event.get_date_object().get_year() or None
+
+
+def _remote_year(date):
+    """
+    Year of a WikiTree date (YYYY-MM-DD), or None if it is not known.
+    """
+    if not date or len(date) < 4 or not date[:4].isdigit():
+        return None
+    return int(date[:4]) or None
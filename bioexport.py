@@ -0,0 +1,406 @@
+# WikiTree - WikiTree Integration
+#
+# Copyright (C) 2021  Hans Boldt
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+"""
+Batch export of WikiTree biographies for many people.
+
+The export is serial: the biographies are generated one after the
+other on the main loop, a few steps at a time, since generating reads
+the database, which may only be done from the main thread. Each
+biography is streamed, in chunks, to a writer thread that writes it
+out to a directory or a zip file, and saves it in the biography store. Biographies whose inputs did not change are taken
+from the store instead of being generated again.
+"""
+
+#-------------------#
+# Python modules    #
+#-------------------#
+import io
+from itertools import groupby
+from operator import itemgetter
+import os
+import queue
+import re
+import threading
+import traceback
+import zipfile
+
+# Other gramplet modules
+from biography import (BiographyGenerator, generate_tracked,
+                       get_stored_biography, settings_digest)
+from pedigree import PedigreeSnapshot, iter_analyse
+from wtindex import WikiTreeIndex
+
+
+ERROR_LOG = 'errors.log'
+
+# Chunks of text waiting to be written
+QUEUE_SIZE = 100
+
+# Characters of text passed to the writer thread at once
+CHUNK_SIZE = 64 * 1024
+
+
+
+def collect_branch(db, person_handle, direction='descendants',
+                   generations=None):
+    """
+    Return the handles of the person and all their descendants or
+    ancestors, up to the given number of generations (all if None).
+    """
+    return list(branch_handles(db, person_handle, direction, generations))
+
+
+def branch_handles(db, person_handle, direction='descendants',
+                   generations=None):
+    """
+    Generate the handles that collect_branch returns, one at a time.
+    Each step reads at most one person and their families.
+    """
+    for generation, handle in walk_branch(db, person_handle, direction,
+                                          generations):
+        yield handle
+
+
+def iter_branch(db, person_handle, direction='descendants',
+                generations=None):
+    """
+    Generate (generation, handles) for the person (generation 0) and
+    each generation of their descendants or ancestors, up to the given
+    number of generations (all if None). Each person is reported once,
+    in the first generation they are found in.
+    """
+    for generation, people in groupby(walk_branch(db, person_handle,
+                                                  direction, generations),
+                                      key=itemgetter(0)):
+        yield generation, [handle for _, handle in people]
+
+
+def walk_branch(db, person_handle, direction='descendants',
+                generations=None):
+    """
+    Generate (generation, handle) for each person of the branch, as
+    iter_branch does, one person at a time. Each step reads at most one
+    person and their families from the database.
+    """
+    relatives_of = _parents if direction == 'ancestors' else _children
+    seen = {person_handle}
+    frontier = [person_handle]
+    generation = 0
+    while frontier:
+        next_frontier = list()
+        for handle in frontier:
+            yield generation, handle
+            if generations is not None and generation >= generations:
+                continue
+            person = db.get_person_from_handle(handle)
+            for relative in relatives_of(db, person):
+                if relative not in seen:
+                    seen.add(relative)
+                    next_frontier.append(relative)
+        frontier = next_frontier
+        generation += 1
+
+
+def _parents(db, person):
+    family_handle = person.get_main_parents_family_handle()
+    if not family_handle:
+        return []
+    family = db.get_family_from_handle(family_handle)
+    return [h for h in (family.get_father_handle(),
+                        family.get_mother_handle()) if h]
+
+
+def _children(db, person):
+    res = list()
+    for family_handle in person.get_family_handle_list():
+        family = db.get_family_from_handle(family_handle)
+        if family:
+            res.extend(child_ref.ref for child_ref in family.get_child_ref_list())
+    return res
+
+
+def collect_filter(db, person_filter):
+    """
+    Return the handles of the people matching a Gramps person filter.
+    """
+    return person_filter.apply(db, list(db.iter_person_handles()))
+
+
+def file_name(db, person_handle, wt_index=None):
+    """
+    File name for a person's biography: the WikiTree id if the person
+    has one, otherwise the Gramps id.
+    """
+    wt_attrs = wt_index.get_attributes(person_handle) if wt_index else None
+    if wt_attrs and wt_attrs.get('id'):
+        name = wt_attrs['id']
+    else:
+        name = db.get_person_from_handle(person_handle).get_gramps_id()
+    return re.sub(r'[^\w.-]', '_', name) + '.txt'
+
+
+
+#====================================================
+#
+# Class BioExportJob
+#
+#====================================================
+
+class BioExportJob:
+    """
+    Generate the biographies for a list of people and write them to a
+    directory, or to a zip file if output ends with '.zip'. Failures
+    are written to an error log next to the biographies.
+
+    generate() is run on the main loop with run_in_idle, and write() on
+    a background thread at the same time.
+
+    If a BioStore is given, only the biographies whose inputs changed
+    since they were stored are generated again.
+    """
+
+    def __init__(self, db, person_handles, output, options=None,
+                 store=None):
+        """
+        Initialize job
+        """
+        self.db = db
+        # May be a generator reading the database, such as
+        # branch_handles(): it is only run by generate()
+        self.person_handles = person_handles
+        self.output = output
+        self.options = options
+        self.store = store
+        self.written = 0
+        self.regenerated = 0
+        self.errors = list()
+        self.failure = None
+        self._settings = None
+        self._queue = queue.Queue(QUEUE_SIZE)
+        self._cancelled = threading.Event()
+
+
+    def cancel(self):
+        """
+        Stop the job. Biographies already generated are kept.
+        """
+        self._cancelled.set()
+
+
+    def generate(self, progress=None):
+        """
+        Generator, run on the main loop: collect the people, then
+        generate their biographies, or take them from the store, a few
+        steps per person, and queue them for write(). progress(done,
+        total) is called after each person.
+        """
+        try:
+            handles = list()
+            for handle in self.person_handles:
+                if self._cancelled.is_set() or not self.db.is_open():
+                    return
+                handles.append(handle)
+                yield
+
+            wt_index = WikiTreeIndex.for_db(self.db)
+            if self.store:
+                self._settings = settings_digest(self.db, self.options)
+            total = len(handles)
+            for done, handle in enumerate(handles, 1):
+                if self._cancelled.is_set() or not self.db.is_open():
+                    return
+                while self._queue.full():
+                    yield
+                name = None
+                try:
+                    name = file_name(self.db, handle, wt_index)
+                    text = None
+                    if self.store:
+                        text = get_stored_biography(self.db, handle,
+                                                    self._settings,
+                                                    self.store)
+                    if text is not None:
+                        self._queue.put(('open', name))
+                        self._queue.put(('text', text))
+                        self._queue.put(('close', None))
+                    else:
+                        yield from self._generate_one(handle, name)
+                except Exception:
+                    self.errors.append((name or handle,
+                                        traceback.format_exc()))
+                if progress:
+                    progress(done, total)
+                yield
+        except Exception as exc:
+            self.failure = exc
+        finally:
+            self._queue.put(None)
+
+
+    def _generate_one(self, handle, name):
+        """
+        Generator producing one biography, and queueing it for write().
+        The pedigree collapse section, if wanted, is read and analysed
+        a few ancestors per step first.
+        """
+        pedigree = None
+        if self.options and self.options.get('include_pedigree_collapse'):
+            snapshot = PedigreeSnapshot(handle)
+            yield from snapshot.walk(self.db)
+            pedigree = yield from iter_analyse(snapshot)
+
+        # The person may have been deleted in the meantime
+        if not self.db.has_person_handle(handle):
+            return
+        person = self.db.get_person_from_handle(handle)
+        out = _QueueWriter(self._queue)
+        self._queue.put(('open', name))
+        try:
+            if self.store:
+                text, inputs = generate_tracked(self.db, person,
+                                                self.options, pedigree, out)
+                entry = (self.db.get_save_path(), handle, self._settings,
+                         inputs)
+            else:
+                BiographyGenerator(self.db, person, self.options,
+                                   pedigree).generate(out)
+                entry = None
+            out.flush()
+        except Exception:
+            self._queue.put(('abandon', None))
+            raise
+        self._queue.put(('close', entry))
+        self.regenerated += 1
+
+
+    def write(self):
+        """
+        Write the queued biographies out, until generate() finishes.
+        Returns the number of biographies written.
+        """
+        self._ended = False
+        try:
+            if self.output.endswith('.zip'):
+                with zipfile.ZipFile(self.output, 'w',
+                                     zipfile.ZIP_DEFLATED) as archive:
+                    self._open = lambda name: io.TextIOWrapper(
+                                    archive.open(name, 'w'), encoding='utf-8')
+                    # A zip entry cannot be removed once written
+                    self._remove = lambda name: None
+                    self._write_queued()
+            else:
+                os.makedirs(self.output, exist_ok=True)
+                self._open = lambda name: open(
+                                    os.path.join(self.output, name),
+                                    'w', encoding='utf-8')
+                self._remove = lambda name: os.remove(
+                                    os.path.join(self.output, name))
+                self._write_queued()
+        finally:
+            # If writing failed, stop generate() and let it finish
+            if not self._ended:
+                self._cancelled.set()
+                while self._queue.get() is not None:
+                    pass
+        if self.failure:
+            raise self.failure
+        return self.written
+
+
+    def _write_queued(self):
+        """
+        Write out each queued biography, then the error log.
+
+        The queue holds ('open', file name), then ('text', chunk) for
+        each chunk of the biography, then ('close', store entry or None)
+        or, if generating it failed, ('abandon', None).
+        """
+        out = None
+        try:
+            while True:
+                item = self._queue.get()
+                if item is None:
+                    self._ended = True
+                    break
+                action, value = item
+                if action == 'open':
+                    name = value
+                    out = self._open(name)
+                    parts = list()
+                elif action == 'text':
+                    out.write(value)
+                    if self.store:
+                        parts.append(value)
+                elif action == 'close':
+                    out.close()
+                    out = None
+                    if value:
+                        self.store.put(*value, ''.join(parts))
+                    self.written += 1
+                else:
+                    out.close()
+                    out = None
+                    self._remove(name)
+        finally:
+            if out:
+                out.close()
+
+        if self.errors:
+            self._write(ERROR_LOG, self._error_log())
+
+
+    def _write(self, name, text):
+        """
+        Write one file to the output.
+        """
+        with self._open(name) as out:
+            out.write(text)
+
+
+    def _error_log(self):
+        return ''.join("%s\n%s\n" % (name, error)
+                       for name, error in self.errors)
+
+
+
+class _QueueWriter:
+    """
+    File-like object passing the text written to it on to the writer
+    thread, in chunks of about CHUNK_SIZE characters.
+    """
+
+    def __init__(self, out_queue):
+        self.queue = out_queue
+        self.parts = list()
+        self.size = 0
+
+
+    def write(self, text):
+        self.parts.append(text)
+        self.size += len(text)
+        if self.size >= CHUNK_SIZE:
+            self.flush()
+        return len(text)
+
+
+    def flush(self):
+        if self.parts:
+            self.queue.put(('text', ''.join(self.parts)))
+            self.parts = list()
+            self.size = 0
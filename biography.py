@@ -0,0 +1,908 @@
+# WikiTree - WikiTree Integration
+#
+# Copyright (C) 2021  Hans Boldt
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+"""
+Generate WikiTree biographies from the Gramps database.
+
+This module has no GTK dependencies, so biographies can be generated
+without a window, e.g. in batch runs.
+"""
+
+#-------------------#
+# Python modules    #
+#-------------------#
+from html import escape
+from bisect import bisect_right
+from datetime import datetime
+import hashlib
+import io
+import json
+import logging
+import re
+
+#-------------------#
+# Gramps modules    #
+#-------------------#
+from gramps.gen.lib import (Person, EventType, EventRoleType)
+from gramps.gen.datehandler import get_date
+from gramps.gen.relationship import get_relationship_calculator
+from gramps.gen.utils.db import (get_birth_or_fallback,
+                                 get_death_or_fallback)
+from gramps.gen.const import GRAMPS_LOCALE as glocale
+from gramps.gen.errors import HandleError
+
+# Other gramplet modules
+from dbproxy import TrackingDb, CachingDb, GETTERS, base_db
+from wtindex import WikiTreeIndex
+from wttemplates import TemplateRegistry
+from wtplaces import PlaceNameCache
+from wtparticipants import ParticipantIndex
+from wtcitations import CitationRegistry
+from pedigree import PedigreeSnapshot, analyse, implex
+
+
+#------------------#
+# Translation      #
+#------------------#
+try:
+    _trans = glocale.get_addon_translator(__file__)
+    _ = _trans.gettext
+except ValueError:
+    _ = glocale.translation.sgettext
+ngettext = glocale.translation.ngettext # else "nearby" comments are ignored
+
+LOG = logging.getLogger(".WikiTree")
+
+
+primary_event_types = (EventType.BIRTH, EventType.DEATH, EventType.MARRIAGE)
+
+# Change this when the generated text changes for the same inputs
+GENERATOR_VERSION = 1
+
+# Template fields and '%%' escapes
+TEMPLATE_RE = re.compile(r'%(?:\((\w+)\)s|%)')
+
+# Sections adding citations, in the order their citations are numbered
+CITING_SECTIONS = ('title', 'summary', 'names', 'events')
+
+DEFAULT_OPTIONS = {
+    'include_witness_events': False,
+    'include_witnesses': False,
+    'include_notes': False,
+    'include_pedigree_collapse': False,
+    }
+
+
+
+
+#====================================================
+#
+# Class BiographyGenerator
+#
+#====================================================
+
+class BiographyGenerator:
+    """
+    Generate the WikiTree biography for a person.
+
+    options is a dict with any of the keys in DEFAULT_OPTIONS.
+    """
+
+    def __init__(self, db, person, options=None, pedigree=None):
+        """
+        Initialize generator. pedigree is the pedigree.Collapse of the
+        person, if already analysed.
+        """
+        # The same people, families and events are looked up many times
+        self.db = db if isinstance(db, CachingDb) else CachingDb(db)
+        self.person = person
+        self.options = dict(DEFAULT_OPTIONS)
+        if options:
+            self.options.update(options)
+        self.include_witness_events = self.options['include_witness_events']
+        self.include_witnesses = self.options['include_witnesses']
+        self.include_notes = self.options['include_notes']
+        self.include_pedigree_collapse \
+                = self.options['include_pedigree_collapse']
+        self.pedigree = pedigree
+
+        self.relcalc = get_relationship_calculator()
+        self.base_db = base_db(db)
+        self.wt_index = WikiTreeIndex.for_db(self.base_db)
+        self.place_names = PlaceNameCache.for_db(self.base_db)
+        self.participant_index = ParticipantIndex.for_db(self.base_db)
+
+        # Inputs read other than through self.db
+        self.places_used = set()
+        self.participants_used = dict()
+        self.tracking_db = db if isinstance(db, TrackingDb) else None
+        if self.tracking_db:
+            db.add_read('Person', person)
+
+
+    def generate(self, out=None):
+        """
+        Generate the biography. It is written to out, any object with a
+        write() method such as an open file, if given; otherwise it is
+        returned as a string.
+        """
+        if out is None:
+            buf = io.StringIO()
+            self.generate(buf)
+            return buf.getvalue()
+
+        self.citations = CitationRegistry(self.db)
+
+        # Locate template
+        bio_template = TemplateRegistry.for_db(self.base_db).get_template()
+        template = bio_template.template
+        header = bio_template.header
+        footer = bio_template.footer
+
+        sections = {
+            'title': self.format_title,
+            'summary': self.format_summary,
+            'names': self.format_names,
+            'events': self.format_events,
+            'notes': self.format_notes,
+            'pedigree': self.format_pedigree,
+            'sources': self.format_sources,
+            'lastupdate': self.format_lastupdate,
+            'timestamp': self.format_timestamp,
+            }
+
+        # Sources are numbered in the order of CITING_SECTIONS, and the
+        # sources section lists them all, so those sections are written
+        # straight out only if the template has them in that order,
+        # before the sources. Otherwise they are rendered first.
+        parts = TEMPLATE_RE.split(template)
+        order = [field for field in parts[1::2] if field]
+        citing = [field for field in order if field in CITING_SECTIONS]
+        in_order = citing == sorted(citing, key=CITING_SECTIONS.index)
+        before_sources = 'sources' not in order \
+                or not set(citing).intersection(
+                        order[order.index('sources'):])
+        if not (in_order and before_sources):
+            for field in CITING_SECTIONS:
+                if field in citing:
+                    buf = io.StringIO()
+                    sections[field](buf)
+                    sections[field] = lambda out, text=buf.getvalue(): \
+                                        out.write(text)
+
+        # Write header, template with sections filled in, and footer
+        if header:
+            out.write(header + "\n")
+        out.write("\n")
+        for i, part in enumerate(parts):
+            if i % 2 == 0:
+                out.write(part)
+            elif part is None:
+                out.write('%')
+            elif part in sections:
+                sections[part](out)
+            else:
+                raise KeyError(part)
+        out.write("\n")
+        if footer:
+            out.write(footer + "\n")
+
+        stats = self.db.stats()
+        LOG.debug("Biography for %s: %d database reads, %d cache hits "
+                  "(%.0f%%)", self.person.get_gramps_id(),
+                  stats['database reads'], stats['hits'],
+                  100 * stats['hit rate'])
+
+
+    def format_title(self, out):
+        name = self.person.get_primary_name()
+        full_name = name.get_first_name() + ' ' + name.get_surname()
+        citations = self.person.get_citation_list()
+        cit_str = self.citations.format_citations(citations)
+        out.write("<b>%s</b> %s\n" % (full_name, cit_str))
+
+
+    def get_spouses(self, person_handle):
+        """
+        Return list of spouses for given person.
+        """
+        spouses = list()
+        db = self.db
+        person = db.get_person_from_handle(person_handle)
+        gender = person.get_gender()
+
+        # Loop through all families
+        for family_handle in person.get_family_handle_list():
+            family = db.get_family_from_handle(family_handle)
+            if not family:
+                continue
+
+            if gender == Person.MALE:
+                spouse_handle = family.get_mother_handle()
+            else:
+                spouse_handle = family.get_father_handle()
+
+            if spouse_handle:
+                spouses.append(spouse_handle)
+
+        return spouses
+
+
+    def format_summary(self, out):
+        out.write("===Summary===\n\n<p>")
+
+        # Information about person
+        gender = self.person.get_gender()
+        wt_attrs = self.wt_index.get_attributes(self.person.get_handle())
+        if wt_attrs:
+            out.write('<b>WikiTree Id:</b> ' + wt_attrs['id'] + "<br/>\n")
+
+        # Birth and death dates:
+        birth_event = get_birth_or_fallback(self.db, self.person)
+        if birth_event:
+            place_handle = birth_event.get_place_handle()
+            place = (', ' + self.get_full_place_name(place_handle)) if place_handle else ''
+            out.write("<b>" + birth_event.get_type().string + ":</b> " \
+                + get_date(birth_event) + place + "<br/>\n")
+
+        death_event = get_death_or_fallback(self.db, self.person)
+        if death_event:
+            place_handle = death_event.get_place_handle()
+            place = (', ' + self.get_full_place_name(place_handle)) if place_handle else ''
+            out.write("<b>" + death_event.get_type().string + ":</b> " \
+                + get_date(death_event) + place + "<br/>\n")
+
+        # Extract parents
+        mother, father = self.relcalc.get_birth_parents(self.db, self.person)
+        if father:
+            out.write('<b>Father:</b> ' + self.format_clickable_name(father) + "<br/>\n")
+        if mother:
+            out.write('<b>Mother:</b> ' + self.format_clickable_name(mother) + "<br/>\n")
+
+        # Extract spouses and children
+        for family_handle in self.person.get_family_handle_list():
+            family = self.db.get_family_from_handle(family_handle)
+            if not family:
+                continue
+
+            # Get name of spouse
+            if gender == Person.MALE:
+                out.write('<b>Wife:</b> ' \
+                    + self.format_clickable_name(family.get_mother_handle()) \
+                    + "<br/>\n")
+            else:
+                out.write('<b>Husband:</b> ' \
+                    + self.format_clickable_name(family.get_father_handle()) \
+                    + "<br/>\n")
+
+            # Get children for spouse:
+            child_ref_list = family.get_child_ref_list()
+            if child_ref_list:
+                out.write("<b>Children:</b>\n<ol>\n")
+                for child_ref in child_ref_list:
+                    out.write("<li>" + self.format_clickable_name(child_ref.ref) + "</li>\n")
+                out.write("</ol><br/>\n")
+
+        out.write("</p>\n")
+
+
+    def format_names(self, out):
+        out.write("===Names===\n\n<ul>\n")
+
+        primary_name = self.person.get_primary_name()
+        out.write(self.format_one_name(primary_name))
+
+        for name in self.person.get_alternate_names():
+            out.write(self.format_one_name(name))
+
+        out.write('</ul>')
+
+
+    def format_one_name(self, name):
+
+        first_name = name.get_first_name()
+        last_name = name.get_surname()
+        name_type = name.get_type()
+        full_name = first_name + ' ' + last_name
+
+        surname_list = name.get_surname_list()
+        surname_type = surname_list[0].origintype.string
+        if surname_type:
+            surname_type = ' (' + surname_type + ')'
+
+        citations = name.get_citation_list()
+        cit_str = self.citations.format_citations(citations)
+
+        res_name = "<li><b>" + str(name_type) + ":</b> " + full_name + surname_type + cit_str + "</li>\n"
+
+        return res_name
+
+
+    def format_events(self, out):
+        out.write("===Events===\n\n")
+        events = self.get_events(children=True)
+        self.parents_listed = False
+
+        # Locate last event, either Death or Burial
+        last_event = None
+        for ev in events:
+            if ev['events'][0]['role'] == 'Primary':
+                event_type = ev['events'][0]['event'].get_type()
+                if event_type in [EventType.DEATH, EventType.BURIAL]:
+                    last_event = ev
+
+        # Output list of events
+        out.write("<ul>\n")
+        for one_date in events:
+            evres = list()
+            for ev in one_date['events']:
+                if not self.include_witness_events    \
+                and ev['role'] in ['Witness', 'Informant']:
+                    continue
+                evres.append('<li>' + self.format_one_event(ev['event'], ev['role']) + "</li>\n")
+            if evres:
+                out.write("<li><b>" + one_date['datestr'] + "</b><br/>\n")
+                out.write("<ul>\n")
+                out.write(''.join(evres))
+                out.write("</ul>\n")
+                out.write("</li>\n")
+
+            if one_date == last_event:
+                break
+        out.write("</ul>\n")
+
+
+    def format_one_event(self, event, role):
+        res = ''
+        primary_roles = ['Primary', 'Family']
+        event_type = event.get_type()
+
+        # Print role if not primary
+        rolestr = ''
+        if role not in primary_roles:
+            rolestr = role + ' at '
+
+        # Get citations
+        citations = event.get_citation_list()
+        cit_str = self.citations.format_citations(citations)
+
+        # Add other participants
+        participants_str = ''
+        participants = self.get_event_participants(event)
+        descr_str = event.get_description()
+        descr_str = (descr_str + ' ') if descr_str else ''
+        witness_str = None
+
+        if role == 'Primary':
+            if event_type in [EventType.BIRTH, EventType.BAPTISM]:
+                if not self.parents_listed:
+                    self.parents_listed = True
+                    father, mother = self.relcalc.get_birth_parents(self.db, self.person)
+                    fname = self.format_clickable_name(father, include_dates=False) if father else ''
+                    mname = self.format_clickable_name(mother, include_dates=False) if mother else ''
+                    participants_str = 'to parents: ' + fname + ', ' + mname + ' '
+
+                if self.include_witnesses:
+                    witnesses = self.filter_participants(participants, EventRoleType.WITNESS)
+                    if len(witnesses) > 1:
+                        witstr = _('Witness') if len(witnesses) == 1 else _('Witnesses')
+                        comma = ''
+                        witness_str = "<b>%s:</b> " % witstr
+                        for wit in witnesses:
+                            witness_str += comma + self.format_clickable_name(wit[1], include_dates=False)
+                            comma = ', '
+
+        elif role == 'Family':
+            if event_type == EventType.MARRIAGE:
+                family = None
+                for p in participants:
+                    if p[0] == 'Family':
+                        family = self.db.get_family_from_handle(p[1])
+                if family:
+                    father_handle = family.get_father_handle()
+                    if father_handle == self.person.get_handle():
+                        spouse_handle = family.get_mother_handle()
+                    else:
+                        spouse_handle = father_handle
+                    participants_str = 'to ' + self.format_clickable_name(spouse_handle, include_dates=False) + ' '
+
+                if self.include_witnesses:
+                    witnesses = self.filter_participants(participants, EventRoleType.WITNESS)
+                    if len(witnesses) > 1:
+                        witstr = _('Witness') if len(witnesses) == 1 else _('Witnesses')
+                        comma = ''
+                        witness_str = "<b>%s:</b> " % witstr # -760,-28
+                        for wit in witnesses:
+                            witness_str += comma + self.format_clickable_name(wit[1], include_dates=False)
+                            comma = ', '
+
+        elif role == 'Parent':
+            rolestr = ''
+            child_handle = self.filter_participants(participants, EventRoleType.PRIMARY)[0][1]
+            child = self.db.get_person_from_handle(child_handle)
+            child_gender = child.get_gender()
+            if child_gender == Person.MALE:
+                child_str = 'son '
+            elif child_gender == Person.FEMALE:
+                child_str = 'daughter '
+            else:
+                child_str = ''
+            participants_str =  'of ' + child_str + self.format_clickable_name(child_handle, include_dates=False)
+
+        elif role == 'Spouse':
+            rolestr = ''
+            spouse_handle = self.filter_participants(participants, EventRoleType.PRIMARY)[0][1]
+            spouse = self.db.get_person_from_handle(spouse_handle)
+            spouse_gender = spouse.get_gender()
+            if spouse_gender == Person.MALE:
+                spouse_str = 'husband '
+            else:
+                spouse_str = 'wife '
+            participants_str =  'of ' + spouse_str + self.format_clickable_name(spouse_handle, include_dates=False)
+
+        elif role in ['Witness', 'Informant']:
+            family = None
+            for p in participants:
+                if p[0] == 'Family':
+                    family = self.db.get_family_from_handle(p[1])
+
+            if family:
+                husb_handle = family.get_father_handle()
+                wife_handle = family.get_mother_handle()
+                hname = self.format_clickable_name(husb_handle, include_dates=False) if husb_handle else ''
+                wname = self.format_clickable_name(wife_handle, include_dates=False) if wife_handle else ''
+                participants_str = 'of ' + hname + ' and ' + wname + ' '
+            else:
+                primary_handle = self.filter_participants(participants, EventRoleType.PRIMARY)[0][1]
+                participants_str = 'of ' + self.format_clickable_name(primary_handle, include_dates=False) + ' '
+
+        # Construct event string
+        res += rolestr + "<b>" + event.get_type().string + "</b> " \
+            + descr_str \
+            + participants_str + ' ' + cit_str + "\n"
+
+        # Add list of witnesses
+        if witness_str:
+            res += "<br/>" + witness_str + "\n"
+
+        # Add place name
+        place_handle = event.get_place_handle()
+        if place_handle:
+            res += "<br/>" + self.get_full_place_name(place_handle) + "\n"
+        return res
+
+
+    def get_full_place_name(self, place_handle):
+        self.places_used.update(self.place_names.get_chain(place_handle))
+        return self.place_names.get_full_name(place_handle)
+
+
+    def get_event_participants(self, event):
+        event_handle = event.get_handle()
+        participants = self.participant_index.get_participants(event_handle)
+        self.participants_used[event_handle] = participants_digest(participants)
+        return participants
+
+
+    def get_inputs(self):
+        """
+        Return the inputs of the last biography generated, as a sorted
+        list of [kind, handle, stamp]. For primary objects, kind is the
+        class name and stamp the change time. The generator must have
+        been given a TrackingDb.
+        """
+        inputs = {(class_name, handle): change
+                  for (class_name, handle), change in self.db.reads.items()}
+        for handle in self.places_used:
+            if ('Place', handle) not in inputs:
+                place = self.base_db.get_place_from_handle(handle)
+                inputs[('Place', handle)] = place.get_change_time()
+        for handle, digest in self.participants_used.items():
+            inputs[('Participants', handle)] = digest
+        return sorted([kind, handle, stamp]
+                      for (kind, handle), stamp in inputs.items())
+
+
+    def filter_participants(self, participants, role):
+        return [x for x in participants if x[2] == role]
+
+
+    def format_clickable_name(self, person_handle, include_dates=True):
+        if not person_handle:
+            return ''
+
+        person = self.db.get_person_from_handle(person_handle)
+        private = person.get_privacy()
+        if private:
+            return '(private)'
+
+        name = person.get_primary_name()
+        name_str = name.get_first_name() + ' ' + name.get_surname()
+        wt_attrs = self.wt_index.get_attributes(person_handle)
+        if wt_attrs:
+            res = '[[%s|%s]]' % (wt_attrs['id'], name_str)
+        else:
+            res = name_str
+
+        if include_dates:
+            res += ' ' + self._info_string(person)
+        return res
+
+
+    def get_events(self, children=False):
+        """
+        Build the timeline of events for the person.
+
+        The person's own events are kept in the order they are listed.
+        Every other event is placed before the first event later than
+        it, and consecutive events on the same date are grouped. The
+        groups are then sorted by date.
+        """
+        gender = self.person.get_gender()
+
+        # Get events for person
+        own_events = list()
+        for event_ref in self.person.get_event_ref_list():
+            event = self.db.get_event_from_handle(event_ref.ref)
+            own_events.append(self._timeline_entry(
+                        event, event_ref.role.string, event_ref,
+                        get_date(event) or '- - - - -'))
+
+        # Get family marriage and child birth/death events
+        other_events = list()
+        for family_handle in self.person.get_family_handle_list():
+            family = self.db.get_family_from_handle(family_handle)
+            family_event_refs = family.get_event_ref_list()
+
+            # Get death event for spouse; it is listed once for every
+            # family event
+            spouse_death = None
+            if family_event_refs:
+                if gender == Person.MALE:
+                    spouse_handle = family.get_mother_handle()
+                else:
+                    spouse_handle = family.get_father_handle()
+                if spouse_handle:
+                    spouse = self.db.get_person_from_handle(spouse_handle)
+                    spouse_death = get_death_or_fallback(self.db, spouse)
+
+            # Get family events
+            for event_ref in family_event_refs:
+                event = self.db.get_event_from_handle(event_ref.ref)
+                other_events.append(self._timeline_entry(
+                            event, event_ref.role.string, event_ref))
+                if spouse_death:
+                    other_events.append(self._timeline_entry(
+                                spouse_death, 'Spouse'))
+
+            # Get birth and death events for children
+            if children:
+                for child_ref in family.get_child_ref_list():
+                    child = self.db.get_person_from_handle(child_ref.ref)
+
+                    birth_event = get_birth_or_fallback(self.db, child)
+                    if birth_event:
+                        other_events.append(self._timeline_entry(
+                                    birth_event, 'Parent'))
+
+                    death_event = get_death_or_fallback(self.db, child)
+                    if death_event:
+                        other_events.append(self._timeline_entry(
+                                    death_event, 'Parent'))
+
+        # An event goes before the first event later than it. The
+        # running maximum date of the person's own events never
+        # decreases, so the slot after the last own event not later
+        # than it is found by bisection. Within a slot, the events are
+        # in date order, and in the order found for equal dates.
+        maxima = list()
+        for ev in own_events:
+            sortval = ev['date'].get_sort_value()
+            maxima.append(max(maxima[-1], sortval) if maxima else sortval)
+
+        slots = [list() for i in range(len(own_events) + 1)]
+        for ev in other_events:
+            slots[bisect_right(maxima, ev['date'].get_sort_value())].append(ev)
+
+        events = list()
+        for slot, own_event in zip(slots, own_events + [None]):
+            slot.sort(key=self._date_sort_value)
+            events.extend(slot)
+            if own_event:
+                events.append(own_event)
+
+        # Merge events with same date
+        res_events = list()
+        for ev in events:
+            if res_events and res_events[-1]['date'] == ev['date']:
+                event_type = ev['events'][0]['event'].get_type()
+                if event_type in primary_event_types \
+                and ev['events'][0]['role'] == 'Primary':
+                    res_events[-1]['events'].insert(0, ev['events'][0])
+                else:
+                    res_events[-1]['events'].append(ev['events'][0])
+            else:
+                res_events.append(ev)
+
+        res_events.sort(key=self._date_sort_value)
+        return res_events
+
+
+    def _timeline_entry(self, event, role, event_ref=None, datestr=None):
+        """
+        Timeline entry for one event.
+        """
+        return {'date': event.get_date_object(),
+                'datestr': get_date(event) if datestr is None else datestr,
+                'events': [ {
+                    'role': role,
+                    'event': event,
+                    'eventref': event_ref} ] }
+
+
+    def _date_sort_value(self, timeline_entry):
+        return timeline_entry['date'].get_sort_value()
+
+
+    def format_notes(self, out):
+        if not self.include_notes:
+            return
+        out.write("===Notes===\n")
+        note_list = self.person.get_note_list()
+        if note_list:
+            out.write("<ul>\n")
+            for note_handle in note_list:
+                note = self.db.get_note_from_handle(note_handle)
+                out.write("<li>%s<br/>\n" % note.get_type().string)
+                if note.get_privacy():
+                    out.write("(private)\n")
+                else:
+                    out.write(self.format_note_text(note.get_styledtext()))
+                out.write("</li>\n")
+            out.write("</ul>\n")
+
+
+    def format_pedigree(self, out):
+        if not self.include_pedigree_collapse:
+            return
+        out.write("===Pedigree Collapse===\n")
+        collapse = self.pedigree
+        if collapse is None:
+            collapse = analyse(PedigreeSnapshot(self.person.get_handle())
+                                    .read(self.db))
+        elif self.tracking_db:
+            self.tracking_db.reads.update(collapse.reads)
+        stats, repeated = collapse.stats, collapse.repeated
+        if not repeated:
+            out.write("<p>No ancestor appears more than once in %d generations.</p>\n"
+                      % len(stats))
+            return
+
+        out.write("<table>\n<tr><th>Generation</th><th>Possible</th>"
+                  "<th>Known</th><th>Distinct</th><th>Repeated</th>"
+                  "<th>Implex</th></tr>\n")
+        for gen in stats:
+            out.write("<tr><td>%d</td><td>%d</td><td>%d</td><td>%d</td>"
+                      "<td>%d</td><td>%.1f%%</td></tr>\n"
+                      % (gen.generation, gen.possible, gen.known,
+                         gen.distinct, gen.repeated, 100 * implex(gen)))
+        out.write("</table>\n")
+
+        if collapse.common:
+            out.write("<p>The father's and mother's lines share %d ancestors.</p>\n"
+                      % len(collapse.common))
+
+        out.write("<b>Ancestors appearing more than once:</b><ul>\n")
+        for handle, (count, generations) in sorted(
+                    repeated.items(), key=lambda item: item[1][1][0]):
+            out.write("<li>%s: %d times, in generations %s</li>\n"
+                      % (self.format_clickable_name(handle), count,
+                         ', '.join(str(g) for g in generations)))
+        out.write("</ul>\n")
+
+
+    def format_sources(self, out):
+        self.citations.prefetch(self.include_notes)
+        out.write('<ol style="list-style-type:decimal">' + "\n")
+        for source, citations in self.citations.iter_sources():
+            out.write("<li>%s\n" % source.get_title())
+
+            out.write('<ol style="list-style-type:lower-alpha">' + "\n")
+
+            for citation in citations:
+                page = citation.get_page()
+                date = get_date(citation)
+                media_list = citation.get_media_list()
+                note_list = citation.get_note_list() if self.include_notes else None
+
+                out.write("<li>")
+                if date:
+                    out.write("<b>Date:</b> %s<br/>\n" % date)
+                if page:
+                    out.write("<b>Page:</b> %s<br/>\n" % page)
+                if media_list:
+                    out.write("<b>Media:</b><ul>\n")
+                    for mediaref in media_list:
+                        media = self.citations.get_media(mediaref.ref)
+                        out.write("<li><b>Description:</b> %s<br/>\n" % media.get_description())
+                        out.write("<b>Path:</b> %s</li>\n" % media.get_path())
+                    out.write("</ul>\n")
+                if note_list:
+                    out.write("<b>Notes:</b><ul>\n")
+                    for note_handle in note_list:
+                        note = self.citations.get_note(note_handle)
+                        out.write("<li>%s<br/>\n" % note.get_type().string)
+                        if note.get_privacy():
+                            out.write("(private)\n")
+                        else:
+                            out.write(self.format_note_text(note.get_styledtext()))
+                        out.write("</li>\n")
+                    out.write("</ul>\n")
+
+                out.write("</li>\n")
+            out.write("</ol></li><br/>\n")
+        out.write("</ol>\n")
+
+
+    def format_note_text(self, text):
+        res = '<p>'
+        lines = [a.string for a in text.split("\n")]
+        res += "<br/>\n".join(lines)
+        return res + "</p>\n"
+
+
+
+    def format_lastupdate(self, out):
+        date = self.person.get_change_time()
+        out.write(datetime.fromtimestamp(date).strftime(
+                    '%Y-%m-%d %H:%M:%S'))
+
+
+    def format_timestamp(self, out):
+        out.write(str(datetime.now()).split('.')[0])
+
+
+    def _fmt_date(self, event, preferred_event_type):
+        """
+        Format the given date.
+        """
+        if not event:
+            return ''
+        sdate = get_date(event)
+        if not sdate:
+            return ''
+        sdate = escape(sdate)
+        date_type = event.get_type()
+        if preferred_event_type == EventType.BIRTH:
+            if date_type != preferred_event_type:
+                return "~<i>%s</i>" % sdate
+            return "*%s" % sdate
+        else:
+            if date_type != preferred_event_type:
+                return "[]<i>%s</i>" % sdate
+            return "+%s" % sdate
+
+        return sdate
+
+
+    def _info_string(self, person):
+        """
+        Information string for a person, including date of birth (or baptism)
+        and date of death (or burial).
+        """
+        bdate = self._fmt_date(get_birth_or_fallback(self.db, person), EventType.BIRTH)
+        ddate = self._fmt_date(get_death_or_fallback(self.db, person), EventType.DEATH)
+
+        if bdate and ddate:
+            return "(%s, %s)" % (bdate, ddate)
+        if bdate:
+            return "(%s)" % (bdate)
+        if ddate:
+            return "(%s)" % (ddate)
+        return ''
+
+
+
+def participants_digest(participants):
+    """
+    Digest of an event's participant list.
+    """
+    return _digest(sorted([p[0], p[1], str(p[2])] for p in participants))
+
+
+def settings_digest(db, options=None):
+    """
+    Digest of everything other than the database objects that the
+    biography depends on: the template, header, footer and options.
+    """
+    full_options = dict(DEFAULT_OPTIONS)
+    if options:
+        full_options.update(options)
+    bio_template = TemplateRegistry.for_db(base_db(db)).get_template()
+    return _digest([GENERATOR_VERSION, full_options, bio_template.template,
+                    bio_template.header, bio_template.footer])
+
+
+def _digest(value):
+    return hashlib.sha1(json.dumps(value, sort_keys=True).encode('utf-8')
+                        ).hexdigest()
+
+
+def inputs_unchanged(db, inputs):
+    """
+    Return True if none of the recorded inputs of a biography changed.
+    An input that was deleted counts as changed.
+    """
+    participant_index = ParticipantIndex.for_db(db)
+    for kind, handle, stamp in inputs:
+        if kind == 'Participants':
+            current = participants_digest(
+                            participant_index.get_participants(handle))
+        else:
+            try:
+                obj = getattr(db, GETTERS[kind])(handle)
+            except HandleError:
+                return False
+            current = obj.get_change_time() if obj else None
+        if current != stamp:
+            return False
+    return True
+
+
+def get_stored_biography(db, person_handle, settings, store):
+    """
+    Return the stored biography for the person if it is still up to
+    date, or None.
+    """
+    entry = store.get(db.get_save_path(), person_handle)
+    if entry is None:
+        return None
+    stored_settings, inputs, text = entry
+    if stored_settings != settings or not inputs_unchanged(db, inputs):
+        return None
+    return text
+
+
+def generate_tracked(db, person, options=None, pedigree=None, out=None):
+    """
+    Generate the WikiTree biography for a person, and return it with
+    the list of inputs it read. If out is given, the biography is
+    written to it, and None is returned in its place.
+    """
+    generator = BiographyGenerator(TrackingDb(db), person, options, pedigree)
+    text = generator.generate(out)
+    return text, generator.get_inputs()
+
+
+def generate_biography(db, person, options=None, store=None, pedigree=None):
+    """
+    Generate the WikiTree biography for a person.
+
+    If a BioStore is given, the stored biography is returned instead
+    if none of its inputs changed since it was generated.
+    """
+    if store is None:
+        return BiographyGenerator(db, person, options, pedigree).generate()
+
+    settings = settings_digest(db, options)
+    text = get_stored_biography(db, person.get_handle(), settings, store)
+    if text is None:
+        text, inputs = generate_tracked(db, person, options, pedigree)
+        store.put(db.get_save_path(), person.get_handle(), settings,
+                  inputs, text)
+    return text
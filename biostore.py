@@ -0,0 +1,119 @@
+# WikiTree - WikiTree Integration
+#
+# Copyright (C) 2021  Hans Boldt
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+"""
+Persistent store of generated biographies and their input fingerprints.
+"""
+
+#-------------------#
+# Python modules    #
+#-------------------#
+import json
+import os
+import sqlite3
+import threading
+
+#-------------------#
+# Gramps modules    #
+#-------------------#
+from gramps.gen.const import HOME_DIR
+
+
+STORE_PATH = os.path.join(HOME_DIR, 'wikitree_bios.sqlite')
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+
+#====================================================
+#
+# Class BioStore
+#
+#====================================================
+
+class BioStore:
+    """
+    SQLite store of generated biographies, keyed by family tree and
+    person handle. Each biography is stored with a digest of the
+    template and options it was generated with, and the list of inputs
+    it read.
+    """
+
+    def __init__(self, path):
+        """
+        Open (or create) the store in the given file.
+        """
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute('CREATE TABLE IF NOT EXISTS bios ('
+                           'tree TEXT, '
+                           'handle TEXT, '
+                           'settings TEXT, '
+                           'inputs TEXT, '
+                           'text TEXT, '
+                           'PRIMARY KEY (tree, handle))')
+        self._conn.commit()
+
+
+    def get(self, tree, handle):
+        """
+        Return (settings, inputs, text) for the person's stored
+        biography, or None.
+        """
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT settings, inputs, text FROM bios '
+                'WHERE tree = ? AND handle = ?', (tree, handle)).fetchone()
+        if row is None:
+            return None
+        return row[0], json.loads(row[1]), row[2]
+
+
+    def put(self, tree, handle, settings, inputs, text):
+        """
+        Store a person's biography.
+        """
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO bios '
+                '(tree, handle, settings, inputs, text) '
+                'VALUES (?, ?, ?, ?, ?)',
+                (tree, handle, settings, json.dumps(inputs), text))
+            self._conn.commit()
+
+
+    def close(self):
+        """
+        Close the store file.
+        """
+        with self._lock:
+            self._conn.close()
+
+
+
+def get_bio_store():
+    """
+    Return the shared biography store, opening it on first use.
+    """
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = BioStore(STORE_PATH)
+        return _store
@@ -0,0 +1,65 @@
+# WikiTree - WikiTree Integration
+#
+# Copyright (C) 2021  Hans Boldt
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+"""
+Detection of the optional packages the gramplet can use.
+
+The checks only look for the packages; nothing is imported until it is
+actually used, so loading the gramplet stays fast. Results are cached.
+"""
+
+#-------------------#
+# Python modules    #
+#-------------------#
+from functools import lru_cache
+import importlib.util
+
+
+
+@lru_cache(maxsize=None)
+def have_module(name):
+    """
+    Return True if the Python module can be imported.
+    """
+    try:
+        return importlib.util.find_spec(name) is not None
+    except (ImportError, ValueError):
+        return False
+
+
+@lru_cache(maxsize=None)
+def have_typelib(namespace, version):
+    """
+    Return True if the GObject introspection library is installed.
+    """
+    import gi
+    try:
+        gi.require_version(namespace, version)
+        return True
+    except ValueError:
+        return False
+
+
+def have_html():
+    """
+    Return True if biographies can be shown formatted: this needs
+    WebKit2, mwparserfromhell and mwcomposerfromhell.
+    """
+    return (have_module('mwparserfromhell')
+            and have_module('mwcomposerfromhell')
+            and have_typelib('WebKit2', '4.0'))
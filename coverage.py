@@ -0,0 +1,162 @@
+# WikiTree - WikiTree Integration
+#
+# Copyright (C) 2021  Hans Boldt
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+"""
+WikiTree coverage of the ancestors or descendants of a person.
+
+The branch is walked and the saved WikiTree ids looked up on the main
+loop, in idle time, since that reads the database. The ids are then
+checked against WikiTree in the background, in blocks, so only one
+block of profiles is held in memory at once.
+"""
+
+#-------------------#
+# Python modules    #
+#-------------------#
+import threading
+
+# Other gramplet modules
+from bioexport import walk_branch
+from wikitreeapi import resolve_profiles
+from wtindex import WikiTreeIndex, profile_status
+
+
+# People whose profiles are fetched together
+BLOCK_SIZE = 500
+
+# Coverage status of a person
+STATUSES = ('linked', 'unlinked', 'missing', 'renamed')
+
+
+
+#====================================================
+#
+# Class CoverageJob
+#
+#====================================================
+
+class CoverageJob:
+    """
+    Tabulate, for each generation of a branch of the tree, how many
+    people are linked to a WikiTree profile, not linked, linked to a
+    profile that no longer exists (missing), or linked to a profile
+    that was renamed or merged (renamed).
+    """
+
+    def __init__(self, db, person_handle, direction='ancestors',
+                 generations=5, block_size=BLOCK_SIZE):
+        """
+        Initialize job
+        """
+        self.db = db
+        self.person_handle = person_handle
+        self.direction = direction
+        self.generations = generations
+        self.block_size = block_size
+
+        # Per generation: list of (handle, saved id or None)
+        self.branch = list()
+        # Per generation: dict from status to number of people
+        self.counts = list()
+        # (generation, handle, saved id, status, current id) for each
+        # missing or renamed profile
+        self.problems = list()
+        self.done_count = 0
+        self._cancelled = threading.Event()
+
+
+    def cancel(self):
+        """
+        Stop the job. The generations already checked are kept.
+        """
+        self._cancelled.set()
+
+
+    def collect(self):
+        """
+        Generator, run on the main loop with run_in_idle: walk the
+        branch and look up the saved WikiTree ids, one person per step.
+        """
+        wt_index = WikiTreeIndex.for_db(self.db)
+        for generation, handle in walk_branch(self.db, self.person_handle,
+                                              self.direction,
+                                              self.generations):
+            if self._cancelled.is_set() or not self.db.is_open():
+                return
+            if generation == len(self.branch):
+                self.branch.append(list())
+            wt_attrs = wt_index.get_attributes(handle)
+            self.branch[generation].append(
+                    (handle, wt_attrs.get('id') if wt_attrs else None))
+            yield
+
+
+    def run(self, progress=None):
+        """
+        Check the ids found by collect(). Does not read the database.
+        progress(done) is called after each block of people. Returns the
+        number of people checked.
+        """
+        for generation, people in enumerate(self.branch):
+            counts = dict.fromkeys(STATUSES, 0)
+            self.counts.append(counts)
+            for start in range(0, len(people), self.block_size):
+                if self._cancelled.is_set():
+                    return self.done_count
+                self._check_block(generation,
+                                  people[start:start+self.block_size],
+                                  counts)
+                if progress:
+                    progress(self.done_count)
+        return self.done_count
+
+
+    def _check_block(self, generation, people, counts):
+        """
+        Check the WikiTree ids of a block of people.
+        """
+        saved = dict()
+        for handle, wikitree_id in people:
+            if wikitree_id:
+                saved[handle] = wikitree_id
+            else:
+                counts['unlinked'] += 1
+
+        profiles = resolve_profiles(saved.values())
+        for handle, wikitree_id in saved.items():
+            status, current = profile_status(wikitree_id,
+                                             profiles.get(wikitree_id))
+            if status == 'ok':
+                counts['linked'] += 1
+            else:
+                counts[status] += 1
+                self.problems.append((generation, handle, wikitree_id,
+                                      status, current))
+        self.done_count += len(people)
+
+
+    def totals(self):
+        """
+        Return the number of people with each status, over all
+        generations.
+        """
+        res = dict.fromkeys(STATUSES, 0)
+        for counts in self.counts:
+            for status, count in counts.items():
+                res[status] += count
+        return res
@@ -0,0 +1,80 @@
+# WikiTree - WikiTree Integration
+#
+# Copyright (C) 2021  Hans Boldt
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+"""
+Base class for caches of data derived from a Gramps database.
+"""
+
+
+_instances = dict()
+
+
+
+#====================================================
+#
+# Class DbSignalCache
+#
+#====================================================
+
+class DbSignalCache:
+    """
+    Cache of data derived from a Gramps database, kept up to date from
+    the database signals.
+
+    Subclasses list the signals they need in SIGNALS, a dict from
+    signal name to the name of the method handling it. Handlers receive
+    the list of changed handles, as the database signals do.
+
+    There is one instance per class for the open database; use
+    for_db() to get it.
+    """
+
+    SIGNALS = dict()
+
+
+    @classmethod
+    def for_db(cls, db):
+        """
+        Return the cache for the given database, creating it (or
+        replacing the cache for a previous database) if necessary.
+        """
+        cache = _instances.get(cls)
+        if cache is None or cache.db is not db:
+            if cache is not None:
+                cache.disconnect()
+            cache = cls(db)
+            _instances[cls] = cache
+        return cache
+
+
+    def __init__(self, db):
+        """
+        Initialize cache and connect to the database signals.
+        """
+        self.db = db
+        self._signal_keys = [db.connect(signal, getattr(self, method))
+                             for signal, method in self.SIGNALS.items()]
+
+
+    def disconnect(self):
+        """
+        Disconnect from the database signals.
+        """
+        for key in self._signal_keys:
+            self.db.disconnect(key)
+        self._signal_keys = list()
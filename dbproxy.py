@@ -0,0 +1,149 @@
+# WikiTree - WikiTree Integration
+#
+# Copyright (C) 2021  Hans Boldt
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+"""
+Database wrappers recording, or caching, the primary objects read
+through them.
+"""
+
+
+# Primary object class name for each getter
+GETTERS = {
+    'Person': 'get_person_from_handle',
+    'Family': 'get_family_from_handle',
+    'Event': 'get_event_from_handle',
+    'Place': 'get_place_from_handle',
+    'Citation': 'get_citation_from_handle',
+    'Source': 'get_source_from_handle',
+    'Note': 'get_note_from_handle',
+    'Media': 'get_media_from_handle',
+    }
+
+
+
+#====================================================
+#
+# Class TrackingDb
+#
+#====================================================
+
+class TrackingDb:
+    """
+    Wrap a database, and record the class, handle and change time of
+    every primary object read through it. Everything else is passed on
+    to the wrapped database.
+    """
+
+    def __init__(self, db):
+        """
+        Initialize wrapper
+        """
+        self.base_db = db
+        self.reads = dict()
+        for class_name, getter in GETTERS.items():
+            setattr(self, getter, self._make_getter(class_name, getter))
+
+
+    def __getattr__(self, name):
+        return getattr(self.base_db, name)
+
+
+    def _make_getter(self, class_name, getter):
+        base_getter = getattr(self.base_db, getter)
+
+        def get_object(handle):
+            obj = base_getter(handle)
+            if obj is not None:
+                self.add_read(class_name, obj)
+            return obj
+        return get_object
+
+
+    def add_read(self, class_name, obj):
+        """
+        Record an object read from the database some other way.
+        """
+        self.reads[(class_name, obj.get_handle())] = obj.get_change_time()
+
+
+
+#====================================================
+#
+# Class CachingDb
+#
+#====================================================
+
+class CachingDb:
+    """
+    Wrap a database, and keep every primary object read through it, so
+    each is read from the database once. Everything else is passed on
+    to the wrapped database.
+
+    The objects are not updated when the database changes, so a
+    CachingDb is meant to be used for one biography, or a batch of them
+    from a read-only database.
+    """
+
+    def __init__(self, db):
+        """
+        Initialize wrapper
+        """
+        self.base_db = db
+        self.hits = 0
+        self.misses = 0
+        for getter in GETTERS.values():
+            setattr(self, getter, self._make_getter(getter))
+
+
+    def __getattr__(self, name):
+        return getattr(self.base_db, name)
+
+
+    def _make_getter(self, getter):
+        base_getter = getattr(self.base_db, getter)
+        cache = dict()
+
+        def get_object(handle):
+            try:
+                obj = cache[handle]
+                self.hits += 1
+            except KeyError:
+                obj = cache[handle] = base_getter(handle)
+                self.misses += 1
+            return obj
+        return get_object
+
+
+    def stats(self):
+        """
+        Return hit/read statistics.
+        """
+        lookups = self.hits + self.misses
+        return {'hits': self.hits,
+                'database reads': self.misses,
+                'hit rate': self.hits / lookups if lookups else 0.0}
+
+
+
+def base_db(db):
+    """
+    Return the database wrapped by db, or db itself.
+    """
+    while isinstance(db, (TrackingDb, CachingDb)):
+        db = db.base_db
+    return db
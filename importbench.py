@@ -0,0 +1,97 @@
+# WikiTree - WikiTree Integration
+#
+# Copyright (C) 2021  Hans Boldt
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+"""
+Measure the time loading the gramplet adds to Gramps startup.
+
+Run from a Python with Gramps installed:
+
+    python3 importbench.py [budget in ms]
+
+Each run imports Gtk and Gramps first, in a fresh interpreter, and then
+times the import of the gramplet alone. Exits with status 1 if the
+median time is over budget, or if a heavy optional package was loaded.
+"""
+
+#-------------------#
+# Python modules    #
+#-------------------#
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+
+# Milliseconds the gramplet may add to startup
+BUDGET_MS = 150
+
+RUNS = 5
+
+# Packages that must only be loaded when first used
+HEAVY_MODULES = ('requests', 'mwparserfromhell', 'mwcomposerfromhell',
+                 'gi.repository.WebKit2')
+
+CHILD = '''
+import json, sys, time
+sys.path.insert(0, %(dir)r)
+import gi
+gi.require_version('Gtk', '3.0')
+from gi.repository import Gtk
+import gramps.gen.plug
+start = time.perf_counter()
+import wikitree
+elapsed = time.perf_counter() - start
+print(json.dumps({'ms': elapsed * 1000,
+                  'loaded': [m for m in %(heavy)r if m in sys.modules]}))
+'''
+
+
+
+def measure():
+    """
+    Import the gramplet in a fresh interpreter. Returns (milliseconds,
+    heavy modules loaded).
+    """
+    code = CHILD % {'dir': os.path.dirname(os.path.abspath(__file__)),
+                    'heavy': HEAVY_MODULES}
+    output = subprocess.run([sys.executable, '-c', code], check=True,
+                            stdout=subprocess.PIPE).stdout
+    result = json.loads(output.decode('utf-8').splitlines()[-1])
+    return result['ms'], result['loaded']
+
+
+def main(argv):
+    budget = float(argv[1]) if len(argv) > 1 else BUDGET_MS
+    times = list()
+    loaded = set()
+    for run in range(RUNS):
+        ms, heavy = measure()
+        times.append(ms)
+        loaded.update(heavy)
+
+    median = statistics.median(times)
+    print("Gramplet import: median %.1f ms, min %.1f ms, max %.1f ms "
+          "(budget %.0f ms)" % (median, min(times), max(times), budget))
+    if loaded:
+        print("Loaded at import: %s" % ', '.join(sorted(loaded)))
+    return 1 if median > budget or loaded else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,327 @@
+# WikiTree - WikiTree Integration
+#
+# Copyright (C) 2021  Hans Boldt
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+"""
+Pedigree collapse: ancestors reached through more than one line.
+
+The parents of the ancestors are first read from the database into a
+PedigreeSnapshot, on the main loop. The analysis itself only uses the
+snapshot, so it can run on any thread, or a few steps at a time on the
+main loop.
+"""
+
+#-------------------#
+# Python modules    #
+#-------------------#
+from collections import namedtuple
+
+
+# Generations followed by default
+MAX_GENERATIONS = 20
+
+
+# Statistics for one generation. possible: 2**generation; known: number
+# of ancestor positions filled; distinct: number of different people
+# filling them; repeated: how many of those also fill another position
+# in this or an earlier generation.
+GenerationStats = namedtuple('GenerationStats',
+                             'generation possible known distinct repeated')
+
+# Result of analyse(). stats: list of GenerationStats; repeated: dict
+# from the handle of each repeated ancestor to (number of positions,
+# generations); common: handles of the ancestors shared by the father's
+# and mother's lines; reads: as in PedigreeSnapshot.
+Collapse = namedtuple('Collapse', 'stats repeated common reads')
+
+
+
+#====================================================
+#
+# Class PedigreeSnapshot
+#
+#====================================================
+
+class PedigreeSnapshot:
+    """
+    The parents in the main family of a person and their ancestors, up
+    to max_generations, as read from the database.
+
+    parents maps each person handle read to a tuple of parent handles.
+    reads maps (class name, handle) of each object read to its change
+    time, like TrackingDb.reads.
+    """
+
+    def __init__(self, person_handle, max_generations=MAX_GENERATIONS):
+        """
+        Initialize snapshot
+        """
+        self.person_handle = person_handle
+        self.max_generations = max_generations
+        self.parents = dict()
+        self.reads = dict()
+
+
+    def walk(self, db):
+        """
+        Generator reading the pedigree from the database, one person
+        per step, for run_in_idle. Returns the snapshot.
+        """
+        seen = {self.person_handle}
+        frontier = [self.person_handle]
+        for generation in range(self.max_generations):
+            following = list()
+            for handle in frontier:
+                parents = self._read_parents(db, handle)
+                self.parents[handle] = parents
+                for parent in parents:
+                    if parent not in seen:
+                        seen.add(parent)
+                        following.append(parent)
+                yield
+            if not following:
+                break
+            frontier = following
+        return self
+
+
+    def read(self, db):
+        """
+        Read the whole pedigree at once. Returns the snapshot.
+        """
+        for step in self.walk(db):
+            pass
+        return self
+
+
+    def _read_parents(self, db, handle):
+        # The database may change between the steps of walk()
+        if not db.has_person_handle(handle):
+            return ()
+        person = db.get_person_from_handle(handle)
+        self.reads[('Person', handle)] = person.get_change_time()
+        family_handle = person.get_main_parents_family_handle()
+        if not family_handle or not db.has_family_handle(family_handle):
+            return ()
+        family = db.get_family_from_handle(family_handle)
+        self.reads[('Family', family_handle)] = family.get_change_time()
+        return tuple(h for h in (family.get_father_handle(),
+                                 family.get_mother_handle()) if h)
+
+
+
+#====================================================
+#
+# Class AncestorGraph
+#
+#====================================================
+
+class AncestorGraph:
+    """
+    The ancestry in a PedigreeSnapshot, as a graph on small integer
+    ids. The set of all ancestors of each person (as an int bitset over
+    the ids) is computed once.
+    """
+
+    def __init__(self, parents):
+        """
+        Initialize graph from a dict of person handle to parent handles.
+        """
+        self.parent_handles = parents
+        self.ids = dict()           # person handle -> id
+        self.handles = list()       # id -> person handle
+        self.parents = list()       # id -> tuple of parent ids, or None
+        self.ancestor_sets = dict()
+
+
+    def get_id(self, handle):
+        """
+        Return the id of the person, assigning one if needed.
+        """
+        person_id = self.ids.get(handle)
+        if person_id is None:
+            person_id = len(self.handles)
+            self.ids[handle] = person_id
+            self.handles.append(handle)
+            self.parents.append(None)
+        return person_id
+
+
+    def get_parents(self, person_id):
+        """
+        Return the ids of the person's parents in their main family.
+        """
+        parents = self.parents[person_id]
+        if parents is None:
+            parents = tuple(self.get_id(h) for h in self.parent_handles.get(
+                                            self.handles[person_id], ()))
+            self.parents[person_id] = parents
+        return parents
+
+
+    def get_ancestors(self, person_id):
+        """
+        Return the bitset of all ancestors of the person.
+        """
+        return run_steps(self.iter_ancestors(person_id))
+
+
+    def iter_ancestors(self, person_id):
+        """
+        Generator computing get_ancestors() one person per step.
+        Returns the bitset.
+        """
+        # Iterative post-order walk: pedigrees can be deep
+        stack = [person_id]
+        while stack:
+            yield
+            current = stack[-1]
+            if current in self.ancestor_sets:
+                stack.pop()
+                continue
+            missing = [p for p in self.get_parents(current)
+                       if p not in self.ancestor_sets and p not in stack]
+            if missing:
+                stack.extend(missing)
+                continue
+            bits = 0
+            for parent in self.get_parents(current):
+                bits |= (1 << parent) | self.ancestor_sets.get(parent, 0)
+            self.ancestor_sets[current] = bits
+            stack.pop()
+        return self.ancestor_sets[person_id]
+
+
+    def common_ancestors(self, person_id):
+        """
+        Return the handles of the ancestors shared by the person's
+        parents, i.e. where the collapse of their pedigree starts.
+        """
+        parents = self.get_parents(person_id)
+        if len(parents) < 2:
+            return []
+        father_side = (1 << parents[0]) | self.get_ancestors(parents[0])
+        mother_side = (1 << parents[1]) | self.get_ancestors(parents[1])
+        return self._handles_of(father_side & mother_side)
+
+
+    def _handles_of(self, bits):
+        res = list()
+        while bits:
+            low = bits & -bits
+            res.append(self.handles[low.bit_length() - 1])
+            bits ^= low
+        return res
+
+
+    def collapse(self, handle, max_generations=MAX_GENERATIONS):
+        """
+        Walk the pedigree of the person one generation at a time.
+        Returns (list of GenerationStats, dict from the handle of each
+        repeated ancestor to (number of positions, generations)).
+
+        Each generation is kept as the number of positions each
+        ancestor fills, so the work grows with the number of distinct
+        ancestors, not with the 2**n positions.
+        """
+        return run_steps(self.iter_collapse(handle, max_generations))
+
+
+    def iter_collapse(self, handle, max_generations=MAX_GENERATIONS):
+        """
+        Generator computing collapse() one person per step. Returns
+        the same result.
+        """
+        stats = list()
+        positions = dict()
+        generations = dict()
+        seen = 1 << self.get_id(handle)
+        current = {self.get_id(handle): 1}
+
+        for generation in range(1, max_generations + 1):
+            following = dict()
+            for person_id, count in current.items():
+                for parent in self.get_parents(person_id):
+                    following[parent] = following.get(parent, 0) + count
+                yield
+            if not following:
+                break
+
+            repeated = 0
+            for person_id, count in following.items():
+                bit = 1 << person_id
+                if count > 1 or seen & bit:
+                    repeated += 1
+                seen |= bit
+                positions[person_id] = positions.get(person_id, 0) + count
+                generations.setdefault(person_id, list()).append(generation)
+            stats.append(GenerationStats(generation, 2 ** generation,
+                                         sum(following.values()),
+                                         len(following), repeated))
+            current = following
+
+        repeated_ancestors = {self.handles[person_id]:
+                                    (count, generations[person_id])
+                              for person_id, count in positions.items()
+                              if count > 1}
+        return stats, repeated_ancestors
+
+
+
+def analyse(snapshot):
+    """
+    Analyse the pedigree collapse of the snapshot's person. Returns a
+    Collapse. Does not read the database, so may run on any thread.
+    """
+    return run_steps(iter_analyse(snapshot))
+
+
+def iter_analyse(snapshot):
+    """
+    Generator doing analyse() one person per step, for run_in_idle or
+    another generator. Returns the Collapse.
+    """
+    graph = AncestorGraph(snapshot.parents)
+    stats, repeated = yield from graph.iter_collapse(
+                                    snapshot.person_handle,
+                                    snapshot.max_generations)
+    person_id = graph.get_id(snapshot.person_handle)
+    for parent in graph.get_parents(person_id):
+        yield from graph.iter_ancestors(parent)
+    common = graph.common_ancestors(person_id)
+    return Collapse(stats, repeated, common, snapshot.reads)
+
+
+def run_steps(steps):
+    """
+    Run a generator to the end, and return the value it returns.
+    """
+    while True:
+        try:
+            next(steps)
+        except StopIteration as stop:
+            return stop.value
+
+
+def implex(stats):
+    """
+    Share of the known ancestor positions in a generation filled by
+    someone who also fills another position.
+    """
+    if not stats.known:
+        return 0.0
+    return 1.0 - stats.distinct / stats.known
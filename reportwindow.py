@@ -0,0 +1,137 @@
+# WikiTree - WikiTree Integration
+#
+# Copyright (C) 2021  Hans Boldt
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+#-------------------#
+# Gramps modules    #
+#-------------------#
+from gramps.gen.const import GRAMPS_LOCALE as glocale
+
+#------------------#
+# Gtk modules      #
+#------------------#
+import gi
+gi.require_version('Gtk', '3.0')
+from gi.repository import Gtk
+
+
+#------------------#
+# Translation      #
+#------------------#
+try:
+    _trans = glocale.get_addon_translator(__file__)
+    _ = _trans.gettext
+except ValueError:
+    _ = glocale.translation.sgettext
+ngettext = glocale.translation.ngettext # else "nearby" comments are ignored
+
+
+
+
+#====================================================
+#
+# Class ReportWindow
+#
+#====================================================
+
+class ReportWindow(Gtk.Window):
+    """
+    Window showing a report as one or more sortable tables, each on its
+    own tab, under a summary line.
+    """
+
+    def __init__(self, title, summary=''):
+        """
+        Initialize window
+        """
+        Gtk.Window.__init__(self, title=title)
+        self.set_default_size(800, 600)
+        box = Gtk.Box(orientation=Gtk.Orientation.VERTICAL)
+        box.homogenous = False
+        box.set_border_width(10)
+
+        self.summary_label = Gtk.Label(label='')
+        self.summary_label.set_xalign(0)
+        self.summary_label.set_markup(summary)
+        box.pack_start(self.summary_label, expand=False, fill=False, padding=5)
+
+        self.notebook = Gtk.Notebook()
+        box.pack_start(self.notebook, expand=True, fill=True, padding=0)
+
+        self.button_box = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL)
+        box.pack_start(self.button_box, expand=False, fill=False, padding=5)
+
+        self.add(box)
+        box.show_all()
+
+
+    def add_table(self, label, columns, rows, on_activate=None):
+        """
+        Add a table on a new tab.
+
+        columns is a list of (title, type) or (title, type, format)
+        tuples, where type is str, int or float and format a %-format
+        for showing the values. rows is a list of tuples with one value
+        per column, and optionally one more value, not shown, that is
+        passed to on_activate(value) when the row is double-clicked.
+        """
+        types = [column[1] for column in columns]
+        if on_activate:
+            types.append(str)
+        store = Gtk.ListStore(*types)
+        for row in rows:
+            store.append(list(row))
+
+        view = Gtk.TreeView(model=store)
+        for i, column in enumerate(columns):
+            renderer = Gtk.CellRendererText()
+            view_column = Gtk.TreeViewColumn(column[0], renderer, text=i)
+            if len(column) > 2:
+                view_column.set_cell_data_func(renderer, self._format_cell,
+                                               (i, column[2]))
+            view_column.set_sort_column_id(i)
+            view_column.set_resizable(True)
+            view.append_column(view_column)
+
+        if on_activate:
+            key_column = len(columns)
+            view.connect('row-activated',
+                         lambda view, path, column:
+                                on_activate(store[path][key_column]))
+
+        window = Gtk.ScrolledWindow()
+        window.add(view)
+        window.show_all()
+        self.notebook.append_page(window, Gtk.Label(label=label))
+        return store
+
+
+    def add_button(self, label, callback):
+        """
+        Add a button below the tables. callback(button) is called when
+        it is clicked.
+        """
+        button = Gtk.Button.new_with_label(label)
+        button.connect('clicked', callback)
+        self.button_box.pack_start(button, expand=False, fill=False, padding=0)
+        button.show()
+        return button
+
+
+    def _format_cell(self, column, renderer, model, tree_iter, data):
+        i, fmt = data
+        renderer.set_property('text', fmt % model.get_value(tree_iter, i))
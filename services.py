@@ -21,27 +21,54 @@
 from html import escape
 import json
 
-
-
-def format_name(person):
+#-------------------#
+# Gramps modules    #
+#-------------------#
+from gramps.gen.lib import Person, EventType, Attribute, AttributeType
+from gramps.gen.db import DbTxn
+from gramps.gen.datehandler import get_date
+from gramps.gen.utils.db import (get_birth_or_fallback,
+                                 get_death_or_fallback)
+from gramps.gen.const import GRAMPS_LOCALE as glocale
+
+#------------------#
+# Translation      #
+#------------------#
+try:
+    _trans = glocale.get_addon_translator(__file__)
+    _ = _trans.gettext
+except ValueError:
+    _ = glocale.translation.sgettext
+
+
+
+def format_name(person, local_lookup=None):
     """
     Format the name with a clickable link.
+
+    If local_lookup is given, it is called with the WikiTree id and
+    should return the handle of the matching local person, if any.
+    Names with no local match are marked.
     """
     if 'LongName' in person:
         longname = person['LongName']
     else:
         longname = person['LongNamePrivate']
 
-    return "<a href=\"%s\">%s</a>" % (person['Name'], longname)
+    text = "<a href=\"%s\">%s</a>" % (person['Name'], longname)
+    if local_lookup and not local_lookup(person['Name']):
+        text += ' <span foreground="grey"><small>%s</small></span>' \
+                % _('(not in tree)')
+    return text
 
 
-def format_person_info(person, show_id=False):
+def format_person_info(person, show_id=False, local_lookup=None):
     """
     Output an information string for the person.
     """
     id_text = (' [' + person['Name'] + ']') if show_id else ''
 
-    text = "<b>Name:</b> " + format_name(person) + id_text + "\n"
+    text = "<b>Name:</b> " + format_name(person, local_lookup) + id_text + "\n"
     text += '<b>Date/place of birth:</b> ' \
             + (person['BirthDate'] if 'BirthDate' in person else '------') + ', ' \
             + ((person['BirthLocation'] if 'BirthLocation' in person else '') or '')  + "\n"
@@ -51,6 +78,41 @@ def format_person_info(person, show_id=False):
     return text
 
 
+def build_search_details(db, person, use_dob=True, use_dod=True, limit=25):
+    """
+    Build the WikiTree searchPerson parameters for the given person.
+    """
+    details = dict()
+
+    primary_name = person.get_primary_name()
+    surname = primary_name.get_primary_surname()
+    details['limit'] = limit
+    details['LastName'] = surname.get_prefix() + ' ' + surname.get_surname()
+    details['FirstName'] = primary_name.get_first_name()
+
+    gender = person.get_gender()
+    if gender == Person.MALE:
+        details['Gender'] = 'Male'
+    elif gender == Person.FEMALE:
+        details['Gender'] = 'Female'
+
+    if use_dob:
+        bdate = get_birth_or_fallback(db, person)
+        if bdate and bdate.get_type() == EventType.BIRTH:
+            bd = get_date(bdate)
+            if len(bd) == 10:
+                details['BirthDate'] = bd
+
+    if use_dod:
+        ddate = get_death_or_fallback(db, person)
+        if ddate and ddate.get_type() == EventType.DEATH:
+            dd = get_date(ddate)
+            if len(dd) == 10:
+                details['DeathDate'] = dd
+
+    return details
+
+
 def format_date(date, preferred_event_type, alt_event_type):
     """
     Format the given date.
@@ -94,27 +156,63 @@ def get_wikitree_attributes_from_handle(db, person_handle):
 
 
 
+def _set_wikitree_id(person, id):
+    """
+    Set the WikiTree id in the person's WikiTree attribute, creating the
+    attribute if necessary. Returns True if the attribute was created.
+    """
+    for attr in person.get_attribute_list():
+        if attr.type.value == 'WikiTree':
+            wtattr = json.loads(attr.get_value())
+            wtattr['id'] = id
+            attr.set_value(json.dumps(wtattr))
+            return False
+
+    wtattr = {'id': id, 'owner': 0}
+    jsattr = json.dumps(wtattr)
+    attr = Attribute()
+    attr.set_type((AttributeType.CUSTOM, 'WikiTree'))
+    attr.set_value(jsattr)
+    person.add_attribute(attr)
+    return True
+
+
 def save_wikitree_id_to_person(db, person, id):
     """
     Save WikiTree id to specified person
     """
-    attrs = person.get_attribute_list()
-
     with DbTxn("WikiTree Marker", db) as transaction:
-        wtattr = None
-        for attr in attrs:
-            if attr.type.value == 'WikiTree':
-                wtattr = json.loads(attr.get_value())
-                wtattr['id'] = id
-                attr.set_value(json.dumps(wtattr))
-                break
-
-        if not wtattr:
-            wtattr = {'id': id, 'owner': 0}
-            jsattr = json.dumps(wtattr)
-            attr = Attribute()
-            attr.set_type((AttributeType.CUSTOM, 'WikiTree'))
-            attr.set_value(jsattr)
-            person.add_attribute(attr)
-
+        _set_wikitree_id(person, id)
         db.commit_person(person, transaction)
+
+
+def save_wikitree_ids(db, assignments, chunk_size=None):
+    """
+    Save WikiTree ids to many people at once.
+
+    assignments is an iterable of (person, id) pairs. They are saved in
+    one batch transaction, or in one per chunk_size people. Signals are
+    not emitted per person; a single rebuild signal is emitted at the
+    end instead. Returns a tuple (created, updated) with the number of
+    attributes created and updated.
+
+    Note that Gramps cannot undo batch transactions: starting one
+    clears the undo history of the family tree. Ask the user first.
+    """
+    pairs = list(assignments)
+    size = chunk_size or len(pairs)
+    created = 0
+    updated = 0
+
+    for start in range(0, len(pairs), size or 1):
+        with DbTxn("WikiTree Marker", db, batch=True) as transaction:
+            for person, id in pairs[start:start+size]:
+                if _set_wikitree_id(person, id):
+                    created += 1
+                else:
+                    updated += 1
+                db.commit_person(person, transaction)
+
+    if pairs:
+        db.request_rebuild()
+    return created, updated
@@ -0,0 +1,175 @@
+# WikiTree - WikiTree Integration
+#
+# Copyright (C) 2021  Hans Boldt
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+"""
+Rendering of WikiTree biographies (wikitext) as HTML.
+
+Parsing a long biography can take seconds, so it is done on a
+background thread, only when the formatted view is shown, and the
+results for recent texts are kept. WebKit2 and the wikitext packages
+are only imported when first used.
+"""
+
+#-------------------#
+# Python modules    #
+#-------------------#
+from collections import OrderedDict
+import hashlib
+from html import escape
+import threading
+
+#-------------------#
+# Gramps modules    #
+#-------------------#
+from gramps.gen.const import GRAMPS_LOCALE as glocale
+
+#------------------#
+# Gtk modules      #
+#------------------#
+import gi
+gi.require_version('Gtk', '3.0')
+from gi.repository import Gtk
+
+# Other gramplet modules
+from worker import run_in_background
+
+
+#------------------#
+# Translation      #
+#------------------#
+try:
+    _trans = glocale.get_addon_translator(__file__)
+    _ = _trans.gettext
+except ValueError:
+    _ = glocale.translation.sgettext
+
+
+# Number of rendered texts kept
+HTML_CACHE_SIZE = 32
+
+
+_html_cache = OrderedDict()
+_html_lock = threading.Lock()
+
+
+
+def render_html(wikitext):
+    """
+    Return the wikitext rendered as HTML. Safe to call from any thread.
+    """
+    key = hashlib.sha1(wikitext.encode('utf-8')).hexdigest()
+    with _html_lock:
+        html = _html_cache.get(key)
+        if html is not None:
+            _html_cache.move_to_end(key)
+            return html
+
+    import mwparserfromhell
+    import mwcomposerfromhell
+    html = mwcomposerfromhell.compose(mwparserfromhell.parse(wikitext))
+
+    with _html_lock:
+        _html_cache[key] = html
+        while len(_html_cache) > HTML_CACHE_SIZE:
+            _html_cache.popitem(last=False)
+    return html
+
+
+
+#====================================================
+#
+# Class FormattedPage
+#
+#====================================================
+
+class FormattedPage:
+    """
+    Notebook page showing wikitext rendered as HTML.
+
+    The text is rendered in the background when the page is shown, and
+    only if it changed since it was last rendered.
+    """
+
+    def __init__(self, notebook, label):
+        """
+        Add the page to the notebook.
+        """
+        gi.require_version('WebKit2', '4.0')
+        from gi.repository import WebKit2
+
+        self.notebook = notebook
+        self.webview = WebKit2.WebView()
+        window = Gtk.ScrolledWindow()
+        window.add(self.webview)
+        self.page_num = notebook.append_page(window, Gtk.Label(label=label))
+        self.text = None
+        self.rendered = None
+        self.task = None
+        notebook.connect('switch-page', self.on_switch_page)
+
+
+    def set_text(self, text):
+        """
+        Set the wikitext to show.
+        """
+        self.text = text
+        if self.notebook.get_current_page() == self.page_num:
+            self.render()
+
+
+    def on_switch_page(self, notebook, page, page_num):
+        if page_num == self.page_num:
+            self.render()
+
+
+    def render(self):
+        """
+        Render the text in the background, unless already done.
+        """
+        if self.text is None or self.text == self.rendered:
+            return
+        self.cancel()
+        text = self.text
+        self.task = run_in_background(
+                        render_html, text,
+                        on_done=lambda html: self.show_html(text, html),
+                        on_error=self.show_error)
+
+
+    def show_html(self, text, html):
+        self.rendered = text
+        self.webview.load_html(html, None)
+
+
+    def show_error(self, exc):
+        """
+        Show why the text could not be rendered. It is rendered again
+        the next time the page is shown.
+        """
+        self.webview.load_html('<p>%s</p>' % escape(
+                                    _('Could not format the text: %s') % exc),
+                               None)
+
+
+    def cancel(self):
+        """
+        Abandon a rendering still in progress.
+        """
+        if self.task:
+            self.task.cancel()
+            self.task = None
@@ -22,7 +22,6 @@
 from html import escape
 from datetime import datetime
 import json
-import requests
 import sys
 
 import pdb
@@ -34,15 +33,6 @@ import gi
 gi.require_version('Gtk', '3.0')
 from gi.repository import Gtk, GLib, Gdk
 
-try:
-    gi.require_version('WebKit2', '4.0')
-    from gi.repository import WebKit2
-
-    import mwparserfromhell
-    import mwcomposerfromhell
-except:
-    pass
-
 
 #-------------------#
 # Gramps modules    #
@@ -60,22 +50,27 @@ from gramps.gen.config import config
 from gramps.gen.utils.symbols import Symbols
 from gramps.gen.const import GRAMPS_LOCALE as glocale
 from gramps.gen.db import DbTxn
+from gramps.gui.dialog import QuestionDialog2
 
 
 # Other gramplet modules
 from biowindow import BioWindow
 from services import (format_name, format_person_info, format_date,
-                      get_wikitree_attributes,
+                      build_search_details, get_wikitree_attributes,
                       get_wikitree_attributes_from_handle,
-                      save_wikitree_id_to_person)
-
-
-have_cosanguinuity = False
-try:
-    from cosanguinuity import Pedigree
-    have_cosanguinuity = True
-except Exception as e:
-    pass
+                      save_wikitree_id_to_person, save_wikitree_ids)
+from wikitreeapi import (get_relatives, get_bio, search_person, get_cache,
+                         set_offline, is_offline)
+from worker import run_in_background, run_in_idle
+from wikihtml import FormattedPage
+from capabilities import have_html
+from automatch import AutoMatchJob, get_queue_path, load_confident_matches
+from wtindex import WikiTreeIndex, check_wikitree_ids
+from bioexport import BioExportJob, branch_handles
+from biostore import get_bio_store
+from coverage import CoverageJob
+from wtdiff import DiffJob, get_diff_store
+from reportwindow import ReportWindow
 
 #------------------#
 # Translation      #
@@ -92,6 +87,9 @@ ngettext = glocale.translation.ngettext # else "nearby" comments are ignored
 
 SEARCH_LIMIT = 25
 
+# Milliseconds without person changes before the gramplet is refreshed
+REFRESH_DELAY = 250
+
 
 
 #====================================================
@@ -105,6 +103,13 @@ class WikiTree(Gramplet):
     def init(self):
         self.active_label = None
         self.id_entry = None
+        self.automatch_job = None
+        self.export_job = None
+        self.coverage_job = None
+        self.diff_job = None
+        self.check_task = None
+        self.changed_handles = set()
+        self.refresh_source = None
 
         self.gui.WIDGET = self.build_gui()
         self.gui.get_container_widget().remove(self.gui.textview)
@@ -112,9 +117,46 @@ class WikiTree(Gramplet):
 
 
     def db_changed(self):
-        self.connect(self.dbstate.db, 'person-add', self.update)
-        self.connect(self.dbstate.db, 'person-delete', self.update)
-        self.connect(self.dbstate.db, 'person-update', self.update)
+        WikiTreeIndex.for_db(self.dbstate.db)
+        self.cancel_refresh()
+        self.connect(self.dbstate.db, 'person-add', self.people_changed)
+        self.connect(self.dbstate.db, 'person-delete', self.people_changed)
+        self.connect(self.dbstate.db, 'person-update', self.people_changed)
+
+
+    def people_changed(self, handle_list):
+        """
+        People were added, updated or deleted. The changes are collected
+        until there are none for REFRESH_DELAY, so an import or a bulk
+        edit causes at most one refresh.
+        """
+        self.changed_handles.update(handle_list)
+        if self.refresh_source is not None:
+            GLib.source_remove(self.refresh_source)
+        self.refresh_source = GLib.timeout_add(REFRESH_DELAY,
+                                               self.refresh_if_changed)
+
+
+    def refresh_if_changed(self):
+        """
+        Refresh the gramplet if the active person was among the changes.
+        """
+        changed = self.changed_handles
+        self.changed_handles = set()
+        self.refresh_source = None
+        if self.get_active('Person') in changed:
+            self.update()
+        return False
+
+
+    def cancel_refresh(self):
+        """
+        Drop the changes collected so far.
+        """
+        if self.refresh_source is not None:
+            GLib.source_remove(self.refresh_source)
+            self.refresh_source = None
+        self.changed_handles = set()
 
 
     def active_changed(self, handle):
@@ -207,15 +249,119 @@ class WikiTree(Gramplet):
         generate_box.pack_start(self.include_notes_button, \
                                 expand=False, fill=False, padding=0)
 
-        if have_cosanguinuity:
-            self.include_pedigree_collapse_button \
-                    = Gtk.CheckButton(label = _('Include pedigree collapse section'))
-            self.include_pedigree_collapse_button.set_active(False)
-            generate_box.pack_start(self.include_pedigree_collapse_button, \
-                                    expand=False, fill=False, padding=0)
+        self.include_pedigree_collapse_button \
+                = Gtk.CheckButton(label = _('Include pedigree collapse section'))
+        self.include_pedigree_collapse_button.set_active(False)
+        generate_box.pack_start(self.include_pedigree_collapse_button, \
+                                expand=False, fill=False, padding=0)
 
         grid.attach(generate_box, 0, 4, 1, 1)
 
+        # Bulk auto-match
+        automatch_box = Gtk.Box(orientation=Gtk.Orientation.VERTICAL)
+
+        self.automatch_button \
+                = Gtk.Button.new_with_label(_("Auto-match Unlinked People"))
+        self.automatch_button.connect("clicked", self.on_click_automatch)
+        automatch_box.pack_start(self.automatch_button, \
+                                 expand=False, fill=False, padding=0)
+
+        self.apply_matches_button \
+                = Gtk.Button.new_with_label(_("Apply Confident Matches"))
+        self.apply_matches_button.set_tooltip_text(
+                _('Save the ids of the auto-match candidates that clearly '
+                  'fit, without review'))
+        self.apply_matches_button.connect("clicked", self.on_click_apply_matches)
+        automatch_box.pack_start(self.apply_matches_button, \
+                                 expand=False, fill=False, padding=0)
+
+        self.automatch_label = Gtk.Label(label='')
+        self.automatch_label.set_xalign(0)
+        automatch_box.pack_start(self.automatch_label, \
+                                 expand=False, fill=False, padding=0)
+
+        grid.attach(automatch_box, 0, 5, 1, 1)
+
+        # Batch bio export
+        export_box = Gtk.Box(orientation=Gtk.Orientation.VERTICAL)
+
+        self.export_button = Gtk.Button.new_with_label(_("Export Bios..."))
+        self.export_button.connect("clicked", self.on_click_export)
+        export_box.pack_start(self.export_button, \
+                              expand=False, fill=False, padding=0)
+
+        branch_box = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL)
+        self.export_direction = Gtk.ComboBoxText()
+        self.export_direction.append('descendants', _('Descendants'))
+        self.export_direction.append('ancestors', _('Ancestors'))
+        self.export_direction.set_active_id('descendants')
+        branch_box.pack_start(self.export_direction, \
+                              expand=False, fill=False, padding=0)
+        branch_box.pack_start(Gtk.Label(label=_('Generations:')), \
+                              expand=False, fill=False, padding=5)
+        self.export_generations = Gtk.SpinButton.new_with_range(1, 99, 1)
+        self.export_generations.set_value(5)
+        branch_box.pack_start(self.export_generations, \
+                              expand=False, fill=False, padding=0)
+        export_box.pack_start(branch_box, \
+                              expand=False, fill=False, padding=0)
+
+        self.export_label = Gtk.Label(label='')
+        self.export_label.set_xalign(0)
+        export_box.pack_start(self.export_label, \
+                              expand=False, fill=False, padding=0)
+
+        grid.attach(export_box, 0, 6, 1, 1)
+
+        # WikiTree coverage of the same branch
+        coverage_box = Gtk.Box(orientation=Gtk.Orientation.VERTICAL)
+
+        self.coverage_button = Gtk.Button.new_with_label(_("Check WikiTree Coverage"))
+        self.coverage_button.set_tooltip_text(
+                _('Check the WikiTree ids of the branch chosen for export'))
+        self.coverage_button.connect("clicked", self.on_click_coverage)
+        coverage_box.pack_start(self.coverage_button, \
+                                expand=False, fill=False, padding=0)
+
+        self.coverage_label = Gtk.Label(label='')
+        self.coverage_label.set_xalign(0)
+        coverage_box.pack_start(self.coverage_label, \
+                                expand=False, fill=False, padding=0)
+
+        grid.attach(coverage_box, 0, 7, 1, 1)
+
+        # Comparison of all linked people with WikiTree
+        diff_box = Gtk.Box(orientation=Gtk.Orientation.VERTICAL)
+
+        self.diff_button = Gtk.Button.new_with_label(_("Compare with WikiTree"))
+        self.diff_button.connect("clicked", self.on_click_diff)
+        diff_box.pack_start(self.diff_button, \
+                            expand=False, fill=False, padding=0)
+
+        self.diff_label = Gtk.Label(label='')
+        self.diff_label.set_xalign(0)
+        diff_box.pack_start(self.diff_label, \
+                            expand=False, fill=False, padding=0)
+
+        grid.attach(diff_box, 0, 8, 1, 1)
+
+        # Check of the saved WikiTree ids
+        check_box = Gtk.Box(orientation=Gtk.Orientation.VERTICAL)
+
+        self.check_button = Gtk.Button.new_with_label(_("Check Saved WikiTree Ids"))
+        self.check_button.set_tooltip_text(
+                _('Find saved ids whose profiles were renamed, merged or deleted'))
+        self.check_button.connect("clicked", self.on_click_check_ids)
+        check_box.pack_start(self.check_button, \
+                             expand=False, fill=False, padding=0)
+
+        self.check_label = Gtk.Label(label='')
+        self.check_label.set_xalign(0)
+        check_box.pack_start(self.check_label, \
+                             expand=False, fill=False, padding=0)
+
+        grid.attach(check_box, 0, 9, 1, 1)
+
         grid.show_all()
         return grid
 
@@ -228,36 +374,13 @@ class WikiTree(Gramplet):
         self.uistate.set_busy_cursor(True)
         db = self.dbstate.db
         active_handle = self.get_active('Person')
-        details = dict()
-
         person = db.get_person_from_handle(active_handle)
-        primary_name = person.get_primary_name()
-        surname = primary_name.get_primary_surname()
-        details['limit'] = SEARCH_LIMIT
-        details['LastName'] = surname.get_prefix() + ' ' + surname.get_surname()
-        details['FirstName'] = primary_name.get_first_name()
-
-        gender = person.get_gender()
-        if gender == Person.MALE:
-            details['Gender'] = 'Male'
-        elif gender == Person.FEMALE:
-            details['Gender'] = 'Female'
-
-        if self.use_dob_button.get_active():
-            bdate = get_birth_or_fallback(db, person)
-            if bdate and bdate.get_type() == EventType.BIRTH:
-                bd = get_date(bdate)
-                if len(bd) == 10:
-                    details['BirthDate'] = bd
-
-        if self.use_dod_button.get_active():
-            ddate = get_death_or_fallback(db, person)
-            if ddate and ddate.get_type() == EventType.DEATH:
-                dd = get_date(ddate)
-                if len(dd) == 10:
-                    details['DeathDate'] = dd
-
-        search_win = SearchWindow(details, db, person)
+        details = build_search_details(db, person,
+                                       self.use_dob_button.get_active(),
+                                       self.use_dod_button.get_active(),
+                                       SEARCH_LIMIT)
+
+        search_win = SearchWindow(details, db, person, self.set_active_person)
         self.uistate.set_busy_cursor(False)
         return
 
@@ -271,24 +394,488 @@ class WikiTree(Gramplet):
         if not wikitree_attr:
             return
 
-        view_win = ViewWindow(wikitree_attr['id'], db, person)
+        view_win = ViewWindow(wikitree_attr['id'], db, person,
+                              self.set_active_person)
         self.uistate.set_busy_cursor(False)
         return
 
 
+    def set_active_person(self, handle):
+        """
+        Make the given person the active person in Gramps.
+        """
+        self.set_active('Person', handle)
+
+
     def on_click_generate(self, arg):
         self.uistate.set_busy_cursor(True)
         db = self.dbstate.db
         active_handle = self.get_active('Person')
         person = db.get_person_from_handle(active_handle)
+        options = self.bio_options()
         bio_win = BioWindow(db, person, \
-                            self.include_witness_events_button.get_active(), \
-                            self.include_witnesses_button.get_active(), \
-                            self.include_notes_button.get_active() )
+                            options['include_witness_events'], \
+                            options['include_witnesses'], \
+                            options['include_notes'], \
+                            options['include_pedigree_collapse'])
         self.uistate.set_busy_cursor(False)
         return
 
 
+    def on_click_automatch(self, arg):
+        """
+        Start the bulk auto-match job, or stop it if it is running.
+        """
+        if self.automatch_job:
+            self.automatch_job.cancel()
+            self.automatch_label.set_text(_('Stopping...'))
+            return
+
+        job = AutoMatchJob(self.dbstate.db,
+                           use_dob=self.use_dob_button.get_active(),
+                           use_dod=self.use_dod_button.get_active())
+        self.automatch_job = job
+        self.automatch_button.set_label(_("Stop Auto-match"))
+        self.automatch_label.set_text(_('Finding unlinked people...'))
+        run_in_idle(job.collect(), on_done=self.automatch_collected,
+                    on_error=self.automatch_finished)
+
+
+    def automatch_collected(self, todo):
+        """
+        The people to search were collected: search in the background.
+        """
+        if not todo:
+            self.automatch_job = None
+            self.automatch_button.set_label(_("Auto-match Unlinked People"))
+            self.automatch_label.set_text(_('No unlinked people left to search'))
+            return
+
+        self.automatch_label.set_text(_('Searching...'))
+        run_in_background(self.automatch_job.run, self.automatch_progress,
+                          on_done=self.automatch_finished,
+                          on_error=self.automatch_finished)
+
+
+    def automatch_progress(self, done, total):
+        """
+        Called on the job's thread after each person searched.
+        """
+        GLib.idle_add(self.automatch_label.set_text,
+                      _('Searched %(done)d of %(total)d')
+                      % {'done': done, 'total': total})
+
+
+    def automatch_finished(self, result):
+        """
+        The auto-match job finished, was stopped or failed.
+        """
+        job = self.automatch_job
+        self.automatch_job = None
+        self.automatch_button.set_label(_("Auto-match Unlinked People"))
+        if isinstance(result, Exception):
+            self.automatch_label.set_text(_('Auto-match failed: %s') % result)
+        else:
+            self.automatch_label.set_text(
+                _('Searched %(done)d people, %(errors)d errors. '
+                  'Review queue: %(path)s')
+                % {'done': result, 'errors': job.errors,
+                   'path': job.queue_path})
+
+
+    def on_click_apply_matches(self, arg):
+        """
+        Save the WikiTree ids of the confident auto-match candidates for
+        the people still unlinked.
+        """
+        db = self.dbstate.db
+        wt_index = WikiTreeIndex.for_db(db)
+        matches = [(handle, wikitree_id)
+                   for handle, wikitree_id
+                   in load_confident_matches(get_queue_path(db))
+                   if db.has_person_handle(handle)
+                   and not wt_index.get_attributes(handle)]
+        if not matches:
+            self.automatch_label.set_text(_('No confident matches to apply'))
+            return
+        created, updated = self.save_ids(matches)
+        if created or updated:
+            self.automatch_label.set_text(
+                _('Saved %d WikiTree ids') % (created + updated))
+
+
+    def save_ids(self, assignments):
+        """
+        Save many WikiTree ids at once, given (handle, id) pairs, after
+        asking the user: the batch transaction used cannot be undone,
+        and clears the undo history. Returns (created, updated).
+        """
+        db = self.dbstate.db
+        if not QuestionDialog2(
+                _('Save %d WikiTree ids?') % len(assignments),
+                _('The ids are saved in a single batch transaction. '
+                  'This cannot be undone, and clears the undo history '
+                  'of the family tree.'),
+                _('Save'), _('Cancel'),
+                parent=self.uistate.window).run():
+            return 0, 0
+
+        self.uistate.set_busy_cursor(True)
+        pairs = list()
+        for handle, wikitree_id in assignments:
+            if db.has_person_handle(handle):
+                pairs.append((db.get_person_from_handle(handle),
+                              wikitree_id))
+        try:
+            return save_wikitree_ids(db, pairs)
+        finally:
+            self.uistate.set_busy_cursor(False)
+
+
+    def bio_options(self):
+        """
+        Biography options selected in the gramplet.
+        """
+        return {'include_witness_events':
+                        self.include_witness_events_button.get_active(),
+                'include_witnesses':
+                        self.include_witnesses_button.get_active(),
+                'include_notes': self.include_notes_button.get_active(),
+                'include_pedigree_collapse':
+                        self.include_pedigree_collapse_button.get_active()}
+
+
+    def on_click_export(self, arg):
+        """
+        Export the bios for a branch of the tree, or stop the export if
+        it is running.
+        """
+        if self.export_job:
+            self.export_job.cancel()
+            self.export_label.set_text(_('Stopping...'))
+            return
+
+        person_handle = self.get_active('Person')
+        if not person_handle:
+            self.export_label.set_text(_('No active person'))
+            return
+
+        dialog = Gtk.FileChooserDialog(
+                    title=_("Export Bios to Folder or Zip File"),
+                    action=Gtk.FileChooserAction.SAVE)
+        dialog.add_buttons(_('_Cancel'), Gtk.ResponseType.CANCEL,
+                           _('_Export'), Gtk.ResponseType.OK)
+        dialog.set_current_name('wikitree-bios.zip')
+        response = dialog.run()
+        output = dialog.get_filename()
+        dialog.destroy()
+        if response != Gtk.ResponseType.OK or not output:
+            return
+
+        db = self.dbstate.db
+        handles = branch_handles(db, person_handle,
+                                 self.export_direction.get_active_id(),
+                                 self.export_generations.get_value_as_int())
+        job = BioExportJob(db, handles, output, self.bio_options(),
+                           store=get_bio_store())
+        self.export_job = job
+        self.export_button.set_label(_("Stop Export"))
+        self.export_label.set_text(_('Exporting...'))
+        run_in_idle(job.generate(self.export_progress))
+        run_in_background(job.write,
+                          on_done=self.export_finished,
+                          on_error=self.export_finished)
+
+
+    def export_progress(self, done, total):
+        """
+        Called on the main loop as bios are generated.
+        """
+        self.export_label.set_text(_('Exported %(done)d of %(total)d')
+                                   % {'done': done, 'total': total})
+
+
+    def export_finished(self, result):
+        """
+        The export finished, was stopped or failed.
+        """
+        job = self.export_job
+        self.export_job = None
+        self.export_button.set_label(_("Export Bios..."))
+        if isinstance(result, Exception):
+            self.export_label.set_text(_('Export failed: %s') % result)
+        else:
+            self.export_label.set_text(
+                _('Exported %(done)d bios (%(new)d regenerated), '
+                  '%(errors)d errors')
+                % {'done': result, 'new': job.regenerated,
+                   'errors': len(job.errors)})
+
+
+    def on_click_coverage(self, arg):
+        """
+        Check the WikiTree coverage of a branch of the tree, or stop the
+        check if it is running.
+        """
+        if self.coverage_job:
+            self.coverage_job.cancel()
+            self.coverage_label.set_text(_('Stopping...'))
+            return
+
+        person_handle = self.get_active('Person')
+        if not person_handle:
+            self.coverage_label.set_text(_('No active person'))
+            return
+
+        job = CoverageJob(self.dbstate.db, person_handle,
+                          self.export_direction.get_active_id(),
+                          self.export_generations.get_value_as_int())
+        self.coverage_job = job
+        self.coverage_button.set_label(_("Stop Coverage Check"))
+        self.coverage_label.set_text(_('Reading the branch...'))
+        run_in_idle(job.collect(), on_done=self.coverage_collected,
+                    on_error=self.coverage_finished)
+
+
+    def coverage_collected(self, result):
+        """
+        The branch was read: check the ids against WikiTree in the
+        background.
+        """
+        self.coverage_label.set_text(_('Checking...'))
+        run_in_background(self.coverage_job.run, self.coverage_progress,
+                          on_done=self.coverage_finished,
+                          on_error=self.coverage_finished)
+
+
+    def coverage_progress(self, done):
+        """
+        Called on the job's thread after each block of people checked.
+        """
+        GLib.idle_add(self.coverage_label.set_text,
+                      _('Checked %d people') % done)
+
+
+    def coverage_finished(self, result):
+        """
+        The coverage check finished, was stopped or failed.
+        """
+        job = self.coverage_job
+        self.coverage_job = None
+        self.coverage_button.set_label(_("Check WikiTree Coverage"))
+        if isinstance(result, Exception):
+            self.coverage_label.set_text(_('Coverage check failed: %s') % result)
+            return
+
+        totals = job.totals()
+        summary = _('<b>%(total)d people:</b> %(linked)d linked, '
+                    '%(unlinked)d not linked, %(missing)d linked to missing '
+                    'profiles, %(renamed)d linked to renamed profiles') \
+                  % dict(totals, total=result)
+        self.coverage_label.set_markup(summary)
+
+        window = ReportWindow(_("WikiTree Coverage"), summary)
+        rows = list()
+        for generation, counts in enumerate(job.counts):
+            people = sum(counts.values())
+            rows.append((generation, people, counts['linked'],
+                         counts['unlinked'], counts['missing'],
+                         counts['renamed'],
+                         100.0 * counts['linked'] / people if people else 0.0))
+        window.add_table(_("Generations"),
+                         [(_('Generation'), int), (_('People'), int),
+                          (_('Linked'), int), (_('Not linked'), int),
+                          (_('Missing'), int), (_('Renamed'), int),
+                          (_('Coverage'), float, '%.1f%%')],
+                         rows)
+
+        db = self.dbstate.db
+        statuses = {'missing': _('Missing'), 'renamed': _('Renamed')}
+        rows = list()
+        for generation, handle, wikitree_id, status, current in job.problems:
+            # Skip people deleted while the check ran
+            if not db.has_person_handle(handle):
+                continue
+            person = db.get_person_from_handle(handle)
+            rows.append((generation,
+                         name_displayer.display(person),
+                         wikitree_id, statuses[status], current or '',
+                         handle))
+        window.add_table(_("Problems"),
+                         [(_('Generation'), int), (_('Name'), str),
+                          (_('Saved Id'), str), (_('Status'), str),
+                          (_('Current Id'), str)],
+                         rows, on_activate=self.set_active_person)
+        window.show_all()
+
+
+    def on_click_diff(self, arg):
+        """
+        Compare every linked person with their WikiTree profile, or stop
+        the comparison if it is running.
+        """
+        if self.diff_job:
+            self.diff_job.cancel()
+            self.diff_label.set_text(_('Stopping...'))
+            return
+
+        self.diff_job = DiffJob(self.dbstate.db, get_diff_store())
+        self.diff_button.set_label(_("Stop Comparison"))
+        self.diff_label.set_text(_('Reading linked people...'))
+        run_in_idle(self.diff_job.collect(), on_done=self.diff_collected,
+                    on_error=self.diff_finished)
+
+
+    def diff_collected(self, result):
+        """
+        The local data was read: compare it with WikiTree in the
+        background.
+        """
+        self.diff_label.set_text(_('Comparing...'))
+        run_in_background(self.diff_job.run, self.diff_progress,
+                          on_done=self.diff_finished,
+                          on_error=self.diff_finished)
+
+
+    def diff_progress(self, done, total):
+        """
+        Called on the job's thread after each block of people compared.
+        """
+        GLib.idle_add(self.diff_label.set_text,
+                      _('Compared %(done)d of %(total)d')
+                      % {'done': done, 'total': total})
+
+
+    def diff_finished(self, result):
+        """
+        The comparison finished, was stopped or failed. The report shows
+        all results stored so far.
+        """
+        job = self.diff_job
+        self.diff_job = None
+        self.diff_button.set_label(_("Compare with WikiTree"))
+        if isinstance(result, Exception):
+            self.diff_label.set_text(_('Comparison failed: %s') % result)
+            return
+
+        db = self.dbstate.db
+        mismatches = job.store.get_mismatches(db.get_save_path())
+        summary = _('Checked %(checked)d people, %(skipped)d unchanged; '
+                    '%(count)d differences') \
+                  % {'checked': result, 'skipped': job.skipped_count,
+                     'count': len(mismatches)}
+        self.diff_label.set_text(summary)
+
+        fields = {'profile': _('Profile'),
+                  'birth date': _('Birth date'),
+                  'birth place': _('Birth place'),
+                  'death date': _('Death date'),
+                  'death place': _('Death place'),
+                  'father': _('Father'),
+                  'mother': _('Mother'),
+                  'spouse': _('Spouse'),
+                  'child': _('Child')}
+        kinds = {'differs': _('Differs'),
+                 'not linked': _('Not linked'),
+                 'renamed': _('Renamed'),
+                 'missing': _('Missing')}
+        names = dict()
+        rows = list()
+        for handle, wikitree_id, field, kind, local, remote in mismatches:
+            if handle not in names:
+                # People deleted since they were checked are skipped
+                names[handle] = name_displayer.display(
+                                    db.get_person_from_handle(handle)) \
+                                if db.has_person_handle(handle) else None
+            if names[handle] is None:
+                continue
+            rows.append((names[handle], wikitree_id,
+                         fields.get(field, field), kinds.get(kind, kind),
+                         local, remote, handle))
+
+        window = ReportWindow(_("Differences with WikiTree"), escape(summary))
+        window.add_table(_("Differences"),
+                         [(_('Name'), str), (_('WikiTree Id'), str),
+                          (_('Field'), str), (_('Status'), str),
+                          (_('Gramps'), str), (_('WikiTree'), str)],
+                         rows, on_activate=self.set_active_person)
+        window.show_all()
+
+
+    def on_click_check_ids(self, arg):
+        """
+        Check every saved WikiTree id against WikiTree, or stop the
+        check if it is running.
+        """
+        if self.check_task:
+            self.check_task.cancel()
+            self.check_task = None
+            self.check_button.set_label(_("Check Saved WikiTree Ids"))
+            self.check_label.set_text(_('Stopped'))
+            return
+
+        # The ids are collected here; only the requests run in the background
+        saved = dict(WikiTreeIndex.for_db(self.dbstate.db).iter_ids())
+        if not saved:
+            self.check_label.set_text(_('No saved WikiTree ids'))
+            return
+
+        self.check_button.set_label(_("Stop Checking"))
+        self.check_label.set_text(_('Checking %d ids...') % len(saved))
+        self.check_task = run_in_background(check_wikitree_ids, saved,
+                                            on_done=self.check_ids_finished,
+                                            on_error=self.check_ids_finished)
+
+
+    def check_ids_finished(self, result):
+        """
+        The check of the saved ids finished or failed.
+        """
+        self.check_task = None
+        self.check_button.set_label(_("Check Saved WikiTree Ids"))
+        if isinstance(result, Exception):
+            self.check_label.set_text(_('Check failed: %s') % result)
+            return
+
+        problems = {handle: entry for handle, entry in result.items()
+                    if entry[1] != 'ok'}
+        summary = _('%(total)d ids checked, %(renamed)d renamed or merged, '
+                    '%(missing)d missing') \
+                  % {'total': len(result),
+                     'renamed': sum(1 for e in problems.values()
+                                    if e[1] == 'renamed'),
+                     'missing': sum(1 for e in problems.values()
+                                    if e[1] == 'missing')}
+        self.check_label.set_text(summary)
+        if not problems:
+            return
+
+        db = self.dbstate.db
+        statuses = {'missing': _('Missing'), 'renamed': _('Renamed')}
+        rows = list()
+        for handle, (wikitree_id, status, current) in problems.items():
+            # Skip people deleted while the check ran
+            if not db.has_person_handle(handle):
+                continue
+            person = db.get_person_from_handle(handle)
+            rows.append((name_displayer.display(person), wikitree_id,
+                         statuses[status], current or '', handle))
+        window = ReportWindow(_("Saved WikiTree Ids"), escape(summary))
+        window.add_table(_("Problems"),
+                         [(_('Name'), str), (_('Saved Id'), str),
+                          (_('Status'), str), (_('Current Id'), str)],
+                         rows, on_activate=self.set_active_person)
+
+        renamed = [(handle, entry[2]) for handle, entry in problems.items()
+                   if entry[1] == 'renamed']
+        if renamed:
+            def update_renamed(button):
+                if any(self.save_ids(renamed)):
+                    button.set_sensitive(False)
+            window.add_button(_('Update Renamed Ids'), update_renamed)
+        window.show_all()
+
+
     def on_click_update_id(self, arg):
         self.uistate.set_busy_cursor(True)
         db = self.dbstate.db
@@ -311,7 +898,7 @@ class WikiTree(Gramplet):
         self.active_label.set_markup('<b>' + name + '</b>')
 
         # Do we have a WikiTree id?
-        wikitree_attr = get_wikitree_attributes(db, person)
+        wikitree_attr = WikiTreeIndex.for_db(db).get_attributes(active_handle)
         if wikitree_attr:
             self.id_entry.set_text(wikitree_attr['id'])
             self.view_button.set_sensitive(True)
@@ -332,20 +919,16 @@ class ViewWindow(Gtk.Window):
     Window showing WikiTree information for a person
     """
 
-    def __init__(self, wikitree_id, db, active_person):
+    def __init__(self, wikitree_id, db, active_person, set_active=None):
         """
-        Initialize window
+        Initialize window. set_active(handle), if given, is called to
+        make a local person the active person.
         """
         self.db = db
         self.active_person = active_person
-
-        # Do we have all the necessary Python packages?
-        self.html_ok = False
-        try:
-            x = mwcomposerfromhell
-            self.html_ok = True
-        except NameError:
-            pass
+        self.set_active = set_active
+        self.wt_index = WikiTreeIndex.for_db(db)
+        self.pending = list()
 
         Gtk.Window.__init__(self, title=_("WikiTree Browser"))
         self.set_default_size(800, 800)
@@ -368,6 +951,18 @@ class ViewWindow(Gtk.Window):
         entry_save_button = Gtk.Button.new_with_label(_('Save Id to Active Person'))
         entry_save_button.connect('clicked', self.on_click_save_id)
         entry_box.pack_start(entry_save_button, expand=False, fill=False, padding=0)
+        self.spinner = Gtk.Spinner()
+        entry_box.pack_start(self.spinner, expand=False, fill=False, padding=5)
+        self.cancel_button = Gtk.Button.new_with_label(_('Cancel'))
+        self.cancel_button.connect('clicked', self.on_click_cancel)
+        entry_box.pack_start(self.cancel_button, expand=False, fill=False, padding=0)
+        self.offline_button = Gtk.CheckButton(label=_('Offline'))
+        self.offline_button.set_active(is_offline())
+        self.offline_button.connect('toggled', self.on_toggle_offline)
+        entry_box.pack_end(self.offline_button, expand=False, fill=False, padding=0)
+        self.local_button = Gtk.CheckButton(label=_('Go to local person'))
+        self.local_button.set_sensitive(set_active is not None)
+        entry_box.pack_end(self.local_button, expand=False, fill=False, padding=0)
         box.pack_start(entry_box, expand=False, fill=False, padding=5)
 
         # Information
@@ -379,11 +974,10 @@ class ViewWindow(Gtk.Window):
         # Biography
         bio_notebook = Gtk.Notebook()
 
-        if self.html_ok:
-            html_window = Gtk.ScrolledWindow()
-            self.html_window = WebKit2.WebView()
-            html_window.add(self.html_window)
-            bio_notebook.append_page(html_window, Gtk.Label(label=_("Formatted")))
+        # Do we have all the necessary Python packages?
+        self.formatted = None
+        if have_html():
+            self.formatted = FormattedPage(bio_notebook, _("Formatted"))
 
         bio_window = Gtk.ScrolledWindow()
         self.bio_label = Gtk.Label(label='')
@@ -397,6 +991,8 @@ class ViewWindow(Gtk.Window):
         self.add(box)
         box.show_all()
         self.show_all()
+        self.cancel_button.hide()
+        self.connect('destroy', self.on_destroy)
         if wikitree_id:
             self.fill_data(wikitree_id)
 
@@ -405,7 +1001,32 @@ class ViewWindow(Gtk.Window):
         """
         """
         id = self.entry_entry.get_text()
-        Gdk.threads_add_idle(GLib.PRIORITY_DEFAULT_IDLE, self.fill_data, id)
+        self.fill_data(id)
+        return True
+
+
+    def on_click_cancel(self, button):
+        """
+        Cancel the requests still outstanding.
+        """
+        self.cancel_requests()
+        return True
+
+
+    def on_destroy(self, window):
+        """
+        Window closed: results still to come are no longer needed.
+        """
+        self.cancel_requests()
+        if self.formatted:
+            self.formatted.cancel()
+
+
+    def on_toggle_offline(self, button):
+        """
+        Switch offline mode (cached responses only) on or off.
+        """
+        set_offline(button.get_active())
         return True
 
 
@@ -426,64 +1047,133 @@ class ViewWindow(Gtk.Window):
     def link_handler(self, label, uri):
         """
         """
-        Gdk.threads_add_idle(GLib.PRIORITY_DEFAULT_IDLE, self.fill_data, uri)
+        if self.local_button.get_active():
+            handle = self.wt_index.get_handle(uri)
+            if handle:
+                self.set_active(handle)
+                return True
+        self.fill_data(uri)
         return True
 
 
     def fill_data(self, wikitree_id):
         """
-        Get and format data for a person
-        """
-        # Get profile information
-        url = 'https://api.wikitree.com/api.php'
-        data = {'action': 'getRelatives',
-                'keys': wikitree_id,
-                'getParents': '1',
-                'getSpouses': '1',
-                'getChildren': '1',
-                'getSiblings': '0',
-                'format': 'json'}
-        profile = requests.post(url, data)
-        info_text = self.format_info(profile)
+        Get and format data for a person.
+
+        Both requests are sent at once in the background, and each part
+        of the window is filled in as its data arrives. Requests for a
+        previously shown person still outstanding are cancelled.
+        """
+        self.cancel_requests()
+        self.entry_entry.set_text(wikitree_id)
+        self.spinner.start()
+        self.cancel_button.show()
+        self.pending = [
+            run_in_background(get_relatives, wikitree_id,
+                              on_done=self.show_info,
+                              on_error=self.show_error),
+            run_in_background(get_bio, wikitree_id,
+                              on_done=self.show_bio,
+                              on_error=self.show_bio_error)]
+
+
+    def cancel_requests(self):
+        """
+        Cancel all outstanding requests.
+        """
+        for task in self.pending:
+            task.cancel()
+        self.pending = list()
+        self.request_finished()
+
+
+    def request_finished(self):
+        """
+        Stop the spinner once all requests have been answered.
+        """
+        self.pending = [task for task in self.pending if not task.done()]
+        if not self.pending:
+            self.spinner.stop()
+            self.cancel_button.hide()
+            stats = get_cache().stats()
+            self.offline_button.set_tooltip_text(
+                _('Cache: %(hits)d hits, %(stale)d stale hits, '
+                  '%(misses)d misses, %(entries)d entries')
+                % {'hits': stats['hits'], 'stale': stats['stale hits'],
+                   'misses': stats['misses'], 'entries': stats['entries']})
+
+
+    def show_info(self, profile):
+        """
+        Show the profile information. A profile that cannot be shown
+        (e.g. missing or private) is reported like a failed request.
+        """
+        try:
+            info_text = self.format_info(profile)
+        except Exception as exc:
+            self.show_error(exc)
+            return
         self.info_label.set_markup(info_text)
+        self.request_finished()
 
-        # Get bio information
-        data = {'action': 'getBio',
-                'key': wikitree_id,
-                'bioFormat': 'both'}
-        bio = requests.post(url,data)
-        bio_text = self.format_bio(bio)
+
+    def show_bio(self, bio):
+        """
+        Show the biography.
+        """
+        try:
+            bio_text = self.format_bio(bio)
+        except Exception as exc:
+            self.show_bio_error(exc)
+            return
 
         self.bio_label.set_text(bio_text)
 
-        if self.html_ok:
-            wikicode = mwparserfromhell.parse(bio_text)
-            html = mwcomposerfromhell.compose(wikicode)
-            self.html_window.load_html(html, None)
+        if self.formatted:
+            self.formatted.set_text(bio_text)
+        self.request_finished()
 
-        self.entry_entry.set_text(wikitree_id)
+
+    def show_error(self, exc):
+        """
+        Show an error from a failed profile request.
+        """
+        self.info_label.set_markup('<b>%s</b> %s\n'
+                                   % (_('Error:'), escape(str(exc))))
+        self.request_finished()
+
+
+    def show_bio_error(self, exc):
+        """
+        Show an error from a failed biography request, in place of the
+        biography, so the profile information is kept.
+        """
+        self.bio_label.set_text(_('Error: %s') % exc)
+        self.request_finished()
 
 
     def format_info(self, response):
         """
         Format basic information about a person.
         """
-        profile = json.loads(response.content)[0]['items'][0]
+        profile = response[0]['items'][0]
         prof = profile['person']
 
+        lookup = self.wt_index.get_handle
+
         # Basic information about person
-        text = format_person_info(prof)
+        text = format_person_info(prof, local_lookup=lookup)
 
         # Extract parents
         fatherx = str(prof['Father'])
         if fatherx and fatherx != '0' and fatherx != 'None':
             father = prof['Parents'][fatherx]
-            text += '<b>Father:</b> ' + format_name(father) + "\n"
+            text += '<b>Father:</b> ' + format_name(father, lookup) + "\n"
         motherx = str(prof['Mother'])
         # pdb.set_trace()
         if motherx and motherx != '0' and motherx != 'None':
             mother = prof['Parents'][motherx]
-            text += '<b>Mother:</b> ' + format_name(mother) + "\n"
+            text += '<b>Mother:</b> ' + format_name(mother, lookup) + "\n"
 
         # Extract spouses and children
         spouses = prof['Spouses'] if 'Spouses' in prof else None
@@ -491,18 +1181,18 @@ class ViewWindow(Gtk.Window):
         if spouses:
             for sp in spouses:
                 spouse = spouses[sp]
-                text += '<b>Spouse/Children:</b> ' + format_name(spouse) + "\n"
+                text += '<b>Spouse/Children:</b> ' + format_name(spouse, lookup) + "\n"
                 # Print out children:
                 for ch in children:
                     child = children[ch]
                     if spouse['Id'] == child['Father'] or spouse['Id'] == child['Mother']:
-                        text += "\t" + format_name(child) + "\n"
+                        text += "\t" + format_name(child, lookup) + "\n"
         elif children:
             # Print out children:
             text += "<b>Children:</b>\n"
             for ch in children:
                 child = children[ch]
-                text += "\t" + format_name(child) + "\n"
+                text += "\t" + format_name(child, lookup) + "\n"
 
         text += "\n<b>Biography:</b>\n"
         return text
@@ -512,7 +1202,7 @@ class ViewWindow(Gtk.Window):
         """
         Format the biography information.
         """
-        bio = json.loads(response.content)[0]
+        bio = response[0]
         text = bio['bio'] if 'bio' in bio else ''
         return text
 
@@ -527,11 +1217,14 @@ class SearchWindow(Gtk.Window):
     """
     """
 
-    def __init__(self, search_details, db, active_person):
+    def __init__(self, search_details, db, active_person, set_active=None):
         """
         """
         self.db = db
         self.active_person = active_person
+        self.set_active = set_active
+        self.wt_index = WikiTreeIndex.for_db(db)
+        self.task = None
 
         Gtk.Window.__init__(self, title=_("WikiTree Search Results"))
         self.set_default_size(800, 800)
@@ -549,6 +1242,13 @@ class SearchWindow(Gtk.Window):
         args_label.set_xalign(0)
         box.pack_start(args_label, expand=False, fill=False, padding=0)
 
+        self.local_button = Gtk.CheckButton(label=_('Go to local person'))
+        self.local_button.set_sensitive(set_active is not None)
+        box.pack_start(self.local_button, expand=False, fill=False, padding=0)
+
+        self.spinner = Gtk.Spinner()
+        box.pack_start(self.spinner, expand=False, fill=False, padding=0)
+
         # Search results
         results_window = Gtk.ScrolledWindow()
 
@@ -562,12 +1262,21 @@ class SearchWindow(Gtk.Window):
         self.add(box)
         box.show_all()
         self.show_all()
+        self.connect('destroy', self.on_destroy)
 
         # Fill search results
         self.search(search_details)
         return
 
 
+    def on_destroy(self, window):
+        """
+        Window closed: the search results are no longer needed.
+        """
+        if self.task:
+            self.task.cancel()
+
+
     def _fix_name(self, name):
         """
         """
@@ -582,13 +1291,31 @@ class SearchWindow(Gtk.Window):
 
     def search(self, search_details):
         """
+        Start the search in the background.
+        """
+        self.spinner.start()
+        self.task = run_in_background(search_person, search_details,
+                                      on_done=self.show_results,
+                                      on_error=self.show_error)
+
+
+    def show_error(self, exc):
+        """
+        Show an error from a failed search.
+        """
+        self.spinner.stop()
+        lab = Gtk.Label(label='')
+        lab.set_markup('<b>%s</b> %s\n' % (_('Error:'), escape(str(exc))))
+        lab.set_xalign(0)
+        self.results_grid.attach(lab, 0, 0, 1, 1)
+        self.results_grid.show_all()
+
+
+    def show_results(self, results):
+        """
+        Show the search results.
         """
-        url = 'https://api.wikitree.com/api.php'
-        data = dict(search_details)
-        data['action'] = 'searchPerson'
-        results = requests.post(url, data)
-        if results:
-            results = json.loads(results.content)
+        self.spinner.stop()
 
         # Print out results
         text = ''
@@ -596,7 +1323,8 @@ class SearchWindow(Gtk.Window):
         for match in results[0]['matches']:
             if 'LongNamePrivate' in match:
                 lab = Gtk.Label(label='')
-                lab.set_markup(format_person_info(match, show_id=True))
+                lab.set_markup(format_person_info(match, show_id=True,
+                                    local_lookup=self.wt_index.get_handle))
                 lab.set_xalign(0)
                 lab.connect('activate_link', self.link_handler)
                 self.results_grid.attach(lab, 0, line, 1, 1)
@@ -622,6 +1350,11 @@ class SearchWindow(Gtk.Window):
     def link_handler(self, label, uri):
         """
         """
+        if self.local_button.get_active():
+            handle = self.wt_index.get_handle(uri)
+            if handle:
+                self.set_active(handle)
+                return True
         Gdk.threads_add_idle(GLib.PRIORITY_DEFAULT_IDLE, self.link_show_view, uri)
         return True
 
@@ -629,7 +1362,7 @@ class SearchWindow(Gtk.Window):
     def link_show_view(self, id):
         """
         """
-        view_win = ViewWindow(id, self.db, self.active_person)
+        view_win = ViewWindow(id, self.db, self.active_person, self.set_active)
 
 
     def on_click_save_id(self, button):
@@ -0,0 +1,286 @@
+# WikiTree - WikiTree Integration
+#
+# Copyright (C) 2021  Hans Boldt
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+"""
+Client for the WikiTree API.
+
+All requests to api.wikitree.com made by the gramplet go through this
+module, so that they share one pooled, keep-alive HTTP session.
+"""
+
+#-------------------#
+# Python modules    #
+#-------------------#
+from concurrent.futures import ThreadPoolExecutor
+import json
+import os
+import threading
+import time
+
+
+#-------------------#
+# Gramps modules    #
+#-------------------#
+from gramps.gen.const import HOME_DIR
+
+# Other gramplet modules
+from apicache import ResponseCache
+
+
+API_URL = 'https://api.wikitree.com/api.php'
+
+# Timeouts in seconds: (connect, read)
+CONNECT_TIMEOUT = 5
+READ_TIMEOUT = 30
+
+# Size of the connection pool to api.wikitree.com
+POOL_SIZE = 8
+
+# Profiles per batched request, and batched requests sent at once
+KEYS_PER_REQUEST = 100
+MAX_CONCURRENT = 4
+
+USER_AGENT = 'Gramps-WikiTree-Gramplet/0.1.0'
+
+CACHE_PATH = os.path.join(HOME_DIR, 'wikitree_cache.sqlite')
+
+
+_session = None
+_session_lock = threading.Lock()
+_executor = None
+_cache = None
+
+
+#====================================================
+#
+# Class RateLimiter
+#
+#====================================================
+
+class RateLimiter:
+    """
+    Limit the rate of calls shared between several threads.
+    """
+
+    def __init__(self, calls_per_second):
+        """
+        Initialize limiter
+        """
+        self.interval = 1.0 / calls_per_second
+        self.next_time = 0.0
+        self.lock = threading.Lock()
+
+
+    def wait(self):
+        """
+        Block until the next call is allowed.
+        """
+        with self.lock:
+            now = time.monotonic()
+            start = max(now, self.next_time)
+            self.next_time = start + self.interval
+        if start > now:
+            time.sleep(start - now)
+
+
+
+def get_session():
+    """
+    Return the shared HTTP session, creating it on first use.
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            # requests is slow to import: only load it when first needed
+            import requests
+            from requests.adapters import HTTPAdapter
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1,
+                                  pool_maxsize=POOL_SIZE)
+            session.mount('https://', adapter)
+            session.headers.update({'User-Agent': USER_AGENT,
+                                    'Accept-Encoding': 'gzip, deflate',
+                                    'Connection': 'keep-alive'})
+            _session = session
+        return _session
+
+
+def get_executor():
+    """
+    Return the thread pool used to send API requests concurrently.
+    """
+    global _executor
+    with _session_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=POOL_SIZE,
+                                           thread_name_prefix='wikitree')
+        return _executor
+
+
+def submit(func, *args, **kwargs):
+    """
+    Run func(*args, **kwargs) on the API thread pool and return a
+    concurrent.futures.Future for its result.
+    """
+    return get_executor().submit(func, *args, **kwargs)
+
+
+def get_cache():
+    """
+    Return the shared response cache, opening it on first use.
+    """
+    global _cache
+    with _session_lock:
+        if _cache is None:
+            _cache = ResponseCache(CACHE_PATH)
+        return _cache
+
+
+def set_offline(offline):
+    """
+    Switch offline mode on or off. In offline mode only cached
+    responses are used, however old they are.
+    """
+    get_cache().offline = offline
+
+
+def is_offline():
+    """
+    Return True if offline mode is on.
+    """
+    return get_cache().offline
+
+
+def close_session():
+    """
+    Close the shared HTTP session and its pooled connections.
+    """
+    global _session
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+            _session = None
+
+
+def api_call(action, params=None, use_cache=True):
+    """
+    Call the WikiTree API with the given action and parameters, and
+    return the decoded JSON response.
+
+    Responses are taken from the cache while they are fresh. If the
+    network is down, an expired cached response is used instead. With
+    use_cache False, the cache is neither read nor written, but offline
+    mode is still obeyed.
+
+    Raises requests.RequestException on network or HTTP errors.
+    """
+    import requests
+
+    data = dict(params) if params else {}
+    data['action'] = action
+    data.setdefault('format', 'json')
+
+    cache = get_cache()
+    if use_cache:
+        value = cache.get(action, data)
+        if value is not None:
+            return value
+    if cache.offline:
+        raise requests.ConnectionError(
+            'Offline, and no cached response for %s' % action)
+
+    try:
+        response = get_session().post(API_URL, data,
+                                      timeout=(CONNECT_TIMEOUT, READ_TIMEOUT))
+        response.raise_for_status()
+    except (requests.ConnectionError, requests.Timeout):
+        if use_cache:
+            value = cache.get(action, data, allow_stale=True)
+            if value is not None:
+                return value
+        raise
+
+    value = json.loads(response.content)
+    if use_cache:
+        cache.put(action, data, value)
+    return value
+
+
+def get_relatives(wikitree_id, parents=True, spouses=True,
+                  children=True, siblings=False, use_cache=True):
+    """
+    Get a profile together with its immediate relatives.
+    """
+    return api_call('getRelatives',
+                    {'keys': wikitree_id,
+                     'getParents': '1' if parents else '0',
+                     'getSpouses': '1' if spouses else '0',
+                     'getChildren': '1' if children else '0',
+                     'getSiblings': '1' if siblings else '0'},
+                    use_cache=use_cache)
+
+
+def resolve_profiles(wikitree_ids, relatives=False,
+                     chunk_size=KEYS_PER_REQUEST,
+                     max_concurrent=MAX_CONCURRENT):
+    """
+    Look up many profiles at once.
+
+    The ids are sent in chunks of chunk_size comma-separated keys, with
+    up to max_concurrent requests in flight. Returns a dict from each
+    requested id to its profile, or to None if the profile could not be
+    found. A profile that was renamed or merged is returned under the
+    requested id, with its current id in the 'Name' field.
+
+    The responses are not cached: they are keyed on the exact list of
+    ids in a chunk, so they would hardly ever be reused, and they would
+    push the profiles viewed one at a time out of the cache.
+    """
+    ids = list(dict.fromkeys(wid for wid in wikitree_ids if wid))
+    chunks = [ids[i:i+chunk_size] for i in range(0, len(ids), chunk_size)]
+    result = dict.fromkeys(ids)
+    if not chunks:
+        return result
+
+    def fetch(chunk):
+        return get_relatives(','.join(chunk), parents=relatives,
+                             spouses=relatives, children=relatives,
+                             use_cache=False)
+
+    workers = min(max_concurrent, len(chunks))
+    with ThreadPoolExecutor(max_workers=workers,
+                            thread_name_prefix='wikitree-batch') as pool:
+        for response in pool.map(fetch, chunks):
+            for item in (response[0].get('items') or []):
+                if item.get('key') in result and 'person' in item:
+                    result[item['key']] = item['person']
+    return result
+
+
+def get_bio(wikitree_id):
+    """
+    Get the biography for a profile.
+    """
+    return api_call('getBio', {'key': wikitree_id, 'bioFormat': 'both'})
+
+
+def search_person(search_details):
+    """
+    Search for profiles matching the given details.
+    """
+    return api_call('searchPerson', search_details)
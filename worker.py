@@ -0,0 +1,215 @@
+# WikiTree - WikiTree Integration
+#
+# Copyright (C) 2021  Hans Boldt
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+"""
+Run slow work without blocking the GTK main loop.
+
+Work that does not touch the database runs on the API thread pool; its
+result is handed back to the main loop with GLib.idle_add, so callbacks
+may safely touch widgets. Work that reads the database must stay on the
+main loop: it is written as a generator, and run a few steps at a time
+when the main loop is idle.
+"""
+
+#-------------------#
+# Python modules    #
+#-------------------#
+import time
+
+#------------------#
+# Gtk modules      #
+#------------------#
+from gi.repository import GLib
+
+# Other gramplet modules
+from wikitreeapi import submit
+
+
+# Seconds of work done per idle callback
+TIME_SLICE = 0.02
+
+
+#====================================================
+#
+# Class BackgroundTask
+#
+#====================================================
+
+class BackgroundTask:
+    """
+    A piece of work running on a background thread.
+
+    on_done(result) or on_error(exception) is called on the main loop
+    when the work finishes, unless the task was cancelled first.
+    """
+
+    def __init__(self, func, args=(), on_done=None, on_error=None):
+        """
+        Initialize task
+        """
+        self.func = func
+        self.args = args
+        self.on_done = on_done
+        self.on_error = on_error
+        self.cancelled = False
+        self.future = None
+
+
+    def start(self):
+        """
+        Start the work on the thread pool.
+        """
+        self.future = submit(self.func, *self.args)
+        self.future.add_done_callback(self._finished)
+        return self
+
+
+    def cancel(self):
+        """
+        Cancel the task. The work is abandoned if it has not started yet,
+        and its result is discarded otherwise.
+        """
+        self.cancelled = True
+        if self.future:
+            self.future.cancel()
+
+
+    def done(self):
+        """
+        Return True if the task has finished or been cancelled.
+        """
+        return self.cancelled or (self.future is not None
+                                  and self.future.done())
+
+
+    def _finished(self, future):
+        """
+        Called on the worker thread when the work finishes.
+        """
+        if not self.cancelled:
+            GLib.idle_add(self._deliver, future)
+
+
+    def _deliver(self, future):
+        """
+        Called on the main loop to hand over the result.
+        """
+        if self.cancelled or future.cancelled():
+            return False
+        exc = future.exception()
+        if exc is not None:
+            if self.on_error:
+                self.on_error(exc)
+        elif self.on_done:
+            self.on_done(future.result())
+        return False
+
+
+
+def run_in_background(func, *args, on_done=None, on_error=None):
+    """
+    Run func(*args) on a background thread and return the started
+    BackgroundTask.
+    """
+    return BackgroundTask(func, args, on_done, on_error).start()
+
+
+
+#====================================================
+#
+# Class IdleTask
+#
+#====================================================
+
+class IdleTask:
+    """
+    A piece of work running on the main loop, a few steps at a time.
+
+    The work is a generator; each step should be short. The value it
+    returns is passed to on_done(result), and an exception it raises to
+    on_error(exception), unless the task was cancelled first.
+    """
+
+    def __init__(self, steps, on_done=None, on_error=None):
+        """
+        Initialize task
+        """
+        self.steps = steps
+        self.on_done = on_done
+        self.on_error = on_error
+        self.cancelled = False
+        self.finished = False
+        self.source = None
+
+
+    def start(self):
+        """
+        Start running the steps when the main loop is idle.
+        """
+        self.source = GLib.idle_add(self._run_slice)
+        return self
+
+
+    def cancel(self):
+        """
+        Cancel the task. No further steps are run.
+        """
+        self.cancelled = True
+        if self.source:
+            GLib.source_remove(self.source)
+            self.source = None
+        self.steps.close()
+
+
+    def done(self):
+        """
+        Return True if the task has finished or been cancelled.
+        """
+        return self.cancelled or self.finished
+
+
+    def _run_slice(self):
+        """
+        Called on the main loop: run steps for up to TIME_SLICE seconds.
+        """
+        deadline = time.monotonic() + TIME_SLICE
+        try:
+            while time.monotonic() < deadline:
+                next(self.steps)
+        except StopIteration as stop:
+            self.finished = True
+            self.source = None
+            if self.on_done:
+                self.on_done(stop.value)
+            return False
+        except Exception as exc:
+            self.finished = True
+            self.source = None
+            if self.on_error:
+                self.on_error(exc)
+            return False
+        return True
+
+
+
+def run_in_idle(steps, on_done=None, on_error=None):
+    """
+    Run the generator steps on the main loop when it is idle, and return
+    the started IdleTask.
+    """
+    return IdleTask(steps, on_done, on_error).start()
@@ -0,0 +1,139 @@
+# WikiTree - WikiTree Integration
+#
+# Copyright (C) 2021  Hans Boldt
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+"""
+Numbering of the sources and citations referred to in a biography.
+"""
+
+
+ALPHA = 'abcdefghijklmnopqrstuvwxyz'
+
+
+
+def citation_letter(n):
+    """
+    Letter(s) for the n'th citation of a source: a, b, ..., z, aa, ...
+    """
+    if n == 0:
+        return 'a'
+    digits = []
+    first = True
+    while n:
+        dig = n % 26
+        if not first:
+            dig -= 1
+        digits.append(dig)
+        n //= 26
+        first = False
+    digits.reverse()
+    return ''.join([ALPHA[x] for x in digits])
+
+
+
+#====================================================
+#
+# Class CitationRegistry
+#
+#====================================================
+
+class CitationRegistry:
+    """
+    Sources and citations cited in one biography, numbered in the
+    order they are first cited: "1a" is the first citation of the first
+    source.
+
+    Every citation and source is read from the database once. The media
+    and notes of all the citations are read in one go by prefetch(),
+    before the sources section is written.
+    """
+
+    def __init__(self, db):
+        """
+        Initialize registry
+        """
+        self.db = db
+        self.sources = dict()       # source handle -> [num, source, citations]
+        self.labels = dict()        # citation handle -> label
+        self.citations = dict()     # citation handle -> citation
+        self.media = dict()
+        self.notes = dict()
+
+
+    def cite(self, cit_handle):
+        """
+        Register a citation, and return its label.
+        """
+        label = self.labels.get(cit_handle)
+        if label is not None:
+            return label
+
+        citation = self.db.get_citation_from_handle(cit_handle)
+        self.citations[cit_handle] = citation
+        source_handle = citation.get_reference_handle()
+        entry = self.sources.get(source_handle)
+        if entry is None:
+            entry = [str(len(self.sources) + 1),
+                     self.db.get_source_from_handle(source_handle),
+                     list()]
+            self.sources[source_handle] = entry
+        label = entry[0] + citation_letter(len(entry[2]))
+        entry[2].append(cit_handle)
+        self.labels[cit_handle] = label
+        return label
+
+
+    def format_citations(self, cit_handles):
+        """
+        Register the citations, and return their superscript labels.
+        """
+        res = ''.join('<sup>[%s]</sup>' % self.cite(cit_handle)
+                      for cit_handle in cit_handles)
+        return ' ' + res if res else ''
+
+
+    def prefetch(self, include_notes=True):
+        """
+        Read the media, and optionally the notes, of all the registered
+        citations, each one once.
+        """
+        for citation in self.citations.values():
+            for mediaref in citation.get_media_list():
+                if mediaref.ref not in self.media:
+                    self.media[mediaref.ref] = \
+                            self.db.get_media_from_handle(mediaref.ref)
+            if include_notes:
+                for note_handle in citation.get_note_list():
+                    if note_handle not in self.notes:
+                        self.notes[note_handle] = \
+                                self.db.get_note_from_handle(note_handle)
+
+
+    def get_media(self, handle):
+        return self.media[handle]
+
+
+    def get_note(self, handle):
+        return self.notes[handle]
+
+
+    def iter_sources(self):
+        """
+        Yield (source, citations) for each source, in numbering order.
+        """
+        for num, source, cit_handles in self.sources.values():
+            yield source, [self.citations[h] for h in cit_handles]
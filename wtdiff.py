@@ -0,0 +1,473 @@
+# WikiTree - WikiTree Integration
+#
+# Copyright (C) 2021  Hans Boldt
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+"""
+Comparison of the people in the Gramps database with their WikiTree
+profiles.
+
+For every person with a WikiTree id, the birth and death dates and
+places, parents, spouses and children are compared with the profile.
+The local data is read on the main loop, in idle time; the profiles
+are then fetched in batches, bypassing the response cache, and compared
+in the background. The results are kept in a SQLite file with a digest
+of the local data they were based on, so a later run only checks the
+people changed locally since, and those not checked for a while.
+"""
+
+#-------------------#
+# Python modules    #
+#-------------------#
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+#-------------------#
+# Gramps modules    #
+#-------------------#
+from gramps.gen.const import HOME_DIR
+from gramps.gen.display.name import displayer as name_displayer
+
+# Other gramplet modules
+from wikitreeapi import resolve_profiles
+from wtindex import WikiTreeIndex, normalize_wikitree_id
+from wtplaces import PlaceNameCache
+
+
+DIFF_PATH = os.path.join(HOME_DIR, 'wikitree_diff.sqlite')
+
+# People whose profiles are fetched together
+BLOCK_SIZE = 200
+
+# Seconds after which a person is checked again even if unchanged locally
+RECHECK_AFTER = 7 * 24 * 60 * 60
+
+# Changed when the table layout changes; the results are then dropped
+SCHEMA_VERSION = 2
+
+# Kinds of mismatch: the values differ; a relative is in the database
+# but not linked to WikiTree; the profile was renamed or merged; the
+# profile does not exist
+KINDS = ('differs', 'not linked', 'renamed', 'missing')
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+
+#====================================================
+#
+# Class DiffStore
+#
+#====================================================
+
+class DiffStore:
+    """
+    SQLite store of the results of comparing people with WikiTree,
+    keyed by family tree and person handle.
+    """
+
+    def __init__(self, path):
+        """
+        Open (or create) the store in the given file.
+        """
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        version = self._conn.execute('PRAGMA user_version').fetchone()[0]
+        if version != SCHEMA_VERSION:
+            self._conn.execute('DROP TABLE IF EXISTS checked')
+            self._conn.execute('DROP TABLE IF EXISTS mismatches')
+            self._conn.execute('PRAGMA user_version = %d' % SCHEMA_VERSION)
+        self._conn.execute('CREATE TABLE IF NOT EXISTS checked ('
+                           'tree TEXT, '
+                           'handle TEXT, '
+                           'wikitree_id TEXT, '
+                           'digest TEXT, '
+                           'checked REAL, '
+                           'PRIMARY KEY (tree, handle))')
+        self._conn.execute('CREATE TABLE IF NOT EXISTS mismatches ('
+                           'tree TEXT, '
+                           'handle TEXT, '
+                           'wikitree_id TEXT, '
+                           'field TEXT, '
+                           'kind TEXT, '
+                           'local TEXT, '
+                           'remote TEXT)')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS mismatches_person '
+                           'ON mismatches (tree, handle)')
+        self._conn.commit()
+
+
+    def get_checked(self, tree):
+        """
+        Return a dict from person handle to (digest, time checked) for
+        the people checked in the tree.
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT handle, digest, checked FROM checked '
+                'WHERE tree = ?', (tree,)).fetchall()
+        return {row[0]: (row[1], row[2]) for row in rows}
+
+
+    def put_results(self, tree, results, checked):
+        """
+        Store the results for some people, replacing their previous
+        results. results is a list of (handle, WikiTree id, digest,
+        list of (field, kind, local, remote)).
+        """
+        with self._lock:
+            for handle, wikitree_id, digest, mismatches in results:
+                self._conn.execute(
+                    'DELETE FROM mismatches WHERE tree = ? AND handle = ?',
+                    (tree, handle))
+                self._conn.executemany(
+                    'INSERT INTO mismatches '
+                    '(tree, handle, wikitree_id, field, kind, local, remote) '
+                    'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                    [(tree, handle, wikitree_id) + mismatch
+                     for mismatch in mismatches])
+                self._conn.execute(
+                    'INSERT OR REPLACE INTO checked '
+                    '(tree, handle, wikitree_id, digest, checked) '
+                    'VALUES (?, ?, ?, ?, ?)',
+                    (tree, handle, wikitree_id, digest, checked))
+            self._conn.commit()
+
+
+    def forget(self, tree, handles):
+        """
+        Remove the results for people no longer linked to WikiTree.
+        """
+        with self._lock:
+            for handle in handles:
+                self._conn.execute(
+                    'DELETE FROM mismatches WHERE tree = ? AND handle = ?',
+                    (tree, handle))
+                self._conn.execute(
+                    'DELETE FROM checked WHERE tree = ? AND handle = ?',
+                    (tree, handle))
+            self._conn.commit()
+
+
+    def get_mismatches(self, tree):
+        """
+        Return all the mismatches found in the tree, as a list of
+        (handle, WikiTree id, field, kind, local, remote).
+        """
+        with self._lock:
+            return self._conn.execute(
+                'SELECT handle, wikitree_id, field, kind, local, remote '
+                'FROM mismatches WHERE tree = ?', (tree,)).fetchall()
+
+
+    def close(self):
+        """
+        Close the store file.
+        """
+        with self._lock:
+            self._conn.close()
+
+
+
+def get_diff_store():
+    """
+    Return the shared comparison store, opening it on first use.
+    """
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = DiffStore(DIFF_PATH)
+        return _store
+
+
+
+#====================================================
+#
+# Class DiffJob
+#
+#====================================================
+
+class DiffJob:
+    """
+    Compare every person with a WikiTree id with their profile, and
+    store the mismatches found.
+
+    collect() is run on the main loop with run_in_idle first, then
+    run() on a background thread.
+    """
+
+    def __init__(self, db, store, block_size=BLOCK_SIZE,
+                 recheck_after=RECHECK_AFTER):
+        """
+        Initialize job
+        """
+        self.db = db
+        self.store = store
+        self.block_size = block_size
+        self.recheck_after = recheck_after
+        self.tree = db.get_save_path()
+        # (handle, WikiTree id, digest, local facts) of each person
+        # to check
+        self.pending = list()
+        self.total = 0
+        self.checked_count = 0
+        self.skipped_count = 0
+        self._cancelled = threading.Event()
+
+
+    def cancel(self):
+        """
+        Stop the job. The people already checked are kept.
+        """
+        self._cancelled.set()
+
+
+    def collect(self):
+        """
+        Generator, run on the main loop with run_in_idle: read the local
+        facts of each linked person, one person per step, and keep
+        those changed since they were last checked.
+        """
+        wt_index = WikiTreeIndex.for_db(self.db)
+        place_names = PlaceNameCache.for_db(self.db)
+        saved = dict(wt_index.iter_ids())
+        checked = self.store.get_checked(self.tree)
+        self.store.forget(self.tree, [handle for handle in checked
+                                      if handle not in saved])
+
+        self.total = len(saved)
+        now = time.time()
+        for handle, wikitree_id in saved.items():
+            if self._cancelled.is_set() or not self.db.is_open():
+                return
+            person = self.db.get_person_from_handle(handle)
+            if not person:
+                continue
+            facts = local_facts(self.db, person, wt_index, place_names)
+            digest = _digest([wikitree_id, facts])
+            previous = checked.get(handle)
+            if previous and previous[0] == digest \
+                    and now - previous[1] < self.recheck_after:
+                self.skipped_count += 1
+            else:
+                self.pending.append((handle, wikitree_id, digest, facts))
+            yield
+
+
+    def run(self, progress=None):
+        """
+        Compare the people found by collect() with WikiTree. Does not
+        read the database. progress(done, total) is called after each
+        block of people. Returns the number of people checked.
+        """
+        for start in range(0, len(self.pending), self.block_size):
+            if self._cancelled.is_set():
+                break
+            self._check_block(self.pending[start:start+self.block_size])
+            if progress:
+                progress(self.checked_count + self.skipped_count, self.total)
+        return self.checked_count
+
+
+    def _check_block(self, block):
+        """
+        Fetch the profiles for a block of people, compare and store.
+        """
+        profiles = resolve_profiles([entry[1] for entry in block],
+                                    relatives=True)
+        results = [(handle, wikitree_id, digest,
+                    compare(wikitree_id, facts, profiles.get(wikitree_id)))
+                   for handle, wikitree_id, digest, facts in block]
+        self.store.put_results(self.tree, results, time.time())
+        self.checked_count += len(block)
+
+
+
+def local_facts(db, person, wt_index, place_names):
+    """
+    Collect what is compared with WikiTree for a person: a dict with
+    the birth and death dates ([year, month, day], 0 if unknown) and
+    places, the WikiTree ids of the parents, and the sorted WikiTree
+    ids of the spouses and children who have one. The names of the
+    relatives with no WikiTree id are kept under 'unlinked father',
+    'unlinked mother', 'unlinked spouses' and 'unlinked children'.
+    """
+    facts = dict()
+    for kind, event_ref in (('birth', person.get_birth_ref()),
+                            ('death', person.get_death_ref())):
+        event = db.get_event_from_handle(event_ref.ref) if event_ref else None
+        date = event.get_date_object() if event else None
+        if date and not date.is_empty():
+            facts[kind + ' date'] = [date.get_year(), date.get_month(),
+                                     date.get_day()]
+        else:
+            facts[kind + ' date'] = None
+        place_handle = event.get_place_handle() if event else None
+        facts[kind + ' place'] = place_names.get_full_name(place_handle) \
+                                    if place_handle else ''
+
+    def wikitree_id(handle):
+        wt_attrs = wt_index.get_attributes(handle)
+        return wt_attrs.get('id') if wt_attrs else None
+
+    def name(handle):
+        relative = db.get_person_from_handle(handle)
+        return name_displayer.display(relative) if relative else ''
+
+    for kind in ('father', 'mother'):
+        facts[kind] = facts['unlinked ' + kind] = None
+    family_handle = person.get_main_parents_family_handle()
+    if family_handle:
+        family = db.get_family_from_handle(family_handle)
+        for kind, handle in (('father', family.get_father_handle()),
+                             ('mother', family.get_mother_handle())):
+            if handle:
+                facts[kind] = wikitree_id(handle)
+                if not facts[kind]:
+                    facts['unlinked ' + kind] = name(handle)
+
+    relatives = {'spouses': set(), 'children': set()}
+    for family_handle in person.get_family_handle_list():
+        family = db.get_family_from_handle(family_handle)
+        if not family:
+            continue
+        for handle in (family.get_father_handle(),
+                       family.get_mother_handle()):
+            if handle and handle != person.get_handle():
+                relatives['spouses'].add(handle)
+        for child_ref in family.get_child_ref_list():
+            relatives['children'].add(child_ref.ref)
+    for kind, handles in relatives.items():
+        ids = {handle: wikitree_id(handle) for handle in handles}
+        facts[kind] = sorted(wid for wid in ids.values() if wid)
+        facts['unlinked ' + kind] = sorted(name(handle)
+                                           for handle, wid in ids.items()
+                                           if not wid)
+    return facts
+
+
+def compare(wikitree_id, facts, profile):
+    """
+    Compare the local facts for a person with the WikiTree profile
+    found for their saved id. Returns a list of (field, kind, local
+    value, WikiTree value), with kind one of KINDS.
+    """
+    if not profile:
+        return [('profile', 'missing', wikitree_id, '')]
+
+    res = list()
+    if _ids_differ(wikitree_id, profile.get('Name')):
+        # Renamed or merged: the rest is compared with the current profile
+        res.append(('profile', 'renamed', wikitree_id, profile.get('Name')))
+
+    for kind in ('birth', 'death'):
+        local = facts[kind + ' date']
+        remote = _remote_date(profile.get(kind.capitalize() + 'Date'))
+        if _dates_differ(local, remote):
+            res.append((kind + ' date', 'differs', _format_date(local),
+                        _format_date(remote)))
+        local = facts[kind + ' place']
+        remote = profile.get(kind.capitalize() + 'Location') or ''
+        if _places_differ(local, remote):
+            res.append((kind + ' place', 'differs', local, remote))
+
+    parents = profile.get('Parents') or {}
+    for kind in ('father', 'mother'):
+        remote_parent = parents.get(str(profile.get(kind.capitalize())))
+        remote = remote_parent.get('Name') if remote_parent else None
+        local = facts[kind]
+        if facts['unlinked ' + kind] is not None:
+            # Either the parent is missing on WikiTree, or the link is
+            res.append((kind, 'not linked', facts['unlinked ' + kind],
+                        remote or ''))
+        elif _ids_differ(local, remote):
+            res.append((kind, 'differs', local or '', remote or ''))
+
+    for kind, field in (('spouses', 'spouse'), ('children', 'child')):
+        local = {normalize_wikitree_id(wid): wid for wid in facts[kind]}
+        remote = {normalize_wikitree_id(rel['Name']): rel['Name']
+                  for rel in (profile.get(kind.capitalize()) or {}).values()
+                  if rel.get('Name')}
+        for key in sorted(local.keys() - remote.keys()):
+            res.append((field, 'differs', local[key], ''))
+        # With relatives not linked locally, those on WikiTree only may
+        # be the same people
+        unlinked = facts['unlinked ' + kind]
+        for key in sorted(remote.keys() - local.keys()):
+            if unlinked:
+                res.append((field, 'not linked', ', '.join(unlinked),
+                            remote[key]))
+            else:
+                res.append((field, 'differs', '', remote[key]))
+    return res
+
+
+def _remote_date(text):
+    """
+    Parse a WikiTree date (YYYY-MM-DD, with 0 for unknown parts).
+    """
+    try:
+        date = [int(part) for part in text.split('-')]
+    except (AttributeError, ValueError):
+        return None
+    if len(date) != 3 or not any(date):
+        return None
+    return date
+
+
+def _dates_differ(local, remote):
+    """
+    Dates differ if one is missing, or in any part known in both.
+    """
+    if not local or not remote:
+        return bool(local) != bool(remote)
+    return any(a and b and a != b for a, b in zip(local, remote))
+
+
+def _format_date(date):
+    if not date:
+        return ''
+    return '%04d-%02d-%02d' % tuple(date)
+
+
+def _places_differ(local, remote):
+    """
+    Places differ if one is missing, or neither mentions the innermost
+    place of the other.
+    """
+    if not local or not remote:
+        return bool(local) != bool(remote)
+    local_parts = [part.strip().lower() for part in local.split(',')]
+    remote_parts = [part.strip().lower() for part in remote.split(',')]
+    return local_parts[0] not in remote_parts \
+            and remote_parts[0] not in local_parts
+
+
+def _ids_differ(local, remote):
+    if not local or not remote:
+        return bool(local) != bool(remote)
+    return normalize_wikitree_id(local) != normalize_wikitree_id(remote)
+
+
+def _digest(value):
+    return hashlib.sha1(json.dumps(value, sort_keys=True).encode('utf-8')
+                        ).hexdigest()
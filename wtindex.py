@@ -0,0 +1,190 @@
+# WikiTree - WikiTree Integration
+#
+# Copyright (C) 2021  Hans Boldt
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+"""
+In-memory index of the WikiTree ids stored in a Gramps database.
+"""
+
+# Other gramplet modules
+from dbcache import DbSignalCache
+from services import get_wikitree_attributes
+from wikitreeapi import resolve_profiles
+
+
+
+def normalize_wikitree_id(wikitree_id):
+    """
+    Normalize a WikiTree id for lookups.
+    """
+    return wikitree_id.strip().replace(' ', '_').lower()
+
+
+
+#====================================================
+#
+# Class WikiTreeIndex
+#
+#====================================================
+
+class WikiTreeIndex(DbSignalCache):
+    """
+    Index from person handle to parsed WikiTree attributes, and from
+    WikiTree id back to person handle.
+
+    The index is built on first use, and kept up to date from the
+    person signals.
+    """
+
+    SIGNALS = {'person-add': 'people_changed',
+               'person-update': 'people_changed',
+               'person-delete': 'people_deleted',
+               'person-rebuild': 'rebuild'}
+
+
+    def __init__(self, db):
+        """
+        Initialize index
+        """
+        super().__init__(db)
+        self.attributes = None
+        self.handles = None
+
+
+    def _build(self):
+        """
+        Build the index from all people in the database.
+        """
+        self.attributes = dict()
+        self.handles = dict()
+        for person in self.db.iter_people():
+            self._add(person)
+
+
+    def _add(self, person):
+        """
+        Add a person to the index.
+        """
+        wt_attrs = get_wikitree_attributes(self.db, person)
+        if wt_attrs:
+            handle = person.get_handle()
+            self.attributes[handle] = wt_attrs
+            if wt_attrs.get('id'):
+                self.handles[normalize_wikitree_id(wt_attrs['id'])] = handle
+
+
+    def _remove(self, handle):
+        """
+        Remove a person from the index.
+        """
+        wt_attrs = self.attributes.pop(handle, None)
+        if wt_attrs and wt_attrs.get('id'):
+            key = normalize_wikitree_id(wt_attrs['id'])
+            if self.handles.get(key) == handle:
+                del self.handles[key]
+
+
+    def people_changed(self, handle_list):
+        """
+        People were added or updated.
+        """
+        if self.attributes is None:
+            return
+        for handle in handle_list:
+            self._remove(handle)
+            person = self.db.get_person_from_handle(handle)
+            if person:
+                self._add(person)
+
+
+    def people_deleted(self, handle_list):
+        """
+        People were deleted.
+        """
+        if self.attributes is None:
+            return
+        for handle in handle_list:
+            self._remove(handle)
+
+
+    def rebuild(self):
+        """
+        The person table was rebuilt: start again on next use.
+        """
+        self.attributes = None
+        self.handles = None
+
+
+    def get_attributes(self, person_handle):
+        """
+        Return the WikiTree attributes for the person, or None.
+        """
+        if self.attributes is None:
+            self._build()
+        return self.attributes.get(person_handle)
+
+
+    def get_handle(self, wikitree_id):
+        """
+        Return the handle of the person with the given WikiTree id, or
+        None.
+        """
+        if self.handles is None:
+            self._build()
+        return self.handles.get(normalize_wikitree_id(wikitree_id))
+
+
+    def iter_ids(self):
+        """
+        Generate (person handle, WikiTree id) for every person with a
+        WikiTree id.
+        """
+        if self.attributes is None:
+            self._build()
+        for handle, wt_attrs in list(self.attributes.items()):
+            if wt_attrs.get('id'):
+                yield handle, wt_attrs['id']
+
+
+
+def check_wikitree_ids(saved):
+    """
+    Check saved WikiTree ids against WikiTree. saved is a dict from
+    person handle to WikiTree id, e.g. from WikiTreeIndex.iter_ids(),
+    collected on the main thread; this function does not read the
+    database, so it can run in the background.
+
+    Returns a dict from person handle to a tuple (saved id, status,
+    current id), where status is 'ok', 'renamed' (the profile was
+    renamed or merged into current id) or 'missing'.
+    """
+    profiles = resolve_profiles(saved.values())
+    return {handle: (wikitree_id,) + profile_status(
+                                        wikitree_id, profiles.get(wikitree_id))
+            for handle, wikitree_id in saved.items()}
+
+
+def profile_status(wikitree_id, profile):
+    """
+    Compare a saved WikiTree id with the profile found for it. Returns
+    (status, current id) with status 'ok', 'renamed' or 'missing'.
+    """
+    if not profile:
+        return 'missing', None
+    if profile.get('Name') != wikitree_id:
+        return 'renamed', profile.get('Name')
+    return 'ok', wikitree_id
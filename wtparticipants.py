@@ -0,0 +1,147 @@
+# WikiTree - WikiTree Integration
+#
+# Copyright (C) 2021  Hans Boldt
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+"""
+Index of the people and families taking part in each event.
+"""
+
+# Other gramplet modules
+from dbcache import DbSignalCache
+
+
+
+#====================================================
+#
+# Class ParticipantIndex
+#
+#====================================================
+
+class ParticipantIndex(DbSignalCache):
+    """
+    Index from event handle to its participants, as a list of
+    [class name, handle, role] entries, one for each person or family
+    referring to the event.
+
+    The index is built with one pass over all people and families on
+    first use, and kept up to date from the person and family signals.
+    """
+
+    SIGNALS = {'person-add': 'people_changed',
+               'person-update': 'people_changed',
+               'person-delete': 'people_deleted',
+               'person-rebuild': 'rebuild',
+               'family-add': 'families_changed',
+               'family-update': 'families_changed',
+               'family-delete': 'families_deleted',
+               'family-rebuild': 'rebuild'}
+
+
+    def __init__(self, db):
+        """
+        Initialize index
+        """
+        super().__init__(db)
+        self.participants = None
+        self.owner_events = None
+
+
+    def _build(self):
+        """
+        Build the index from all people and families.
+        """
+        self.participants = dict()
+        self.owner_events = dict()
+        for person in self.db.iter_people():
+            self._add('Person', person)
+        for family in self.db.iter_families():
+            self._add('Family', family)
+
+
+    def _add(self, class_name, obj):
+        """
+        Add the event references of a person or family.
+        """
+        handle = obj.get_handle()
+        events = list()
+        for event_ref in obj.get_event_ref_list():
+            if event_ref.ref in events:
+                continue
+            events.append(event_ref.ref)
+            self.participants.setdefault(event_ref.ref, list()).append(
+                        [class_name, handle, event_ref.get_role()])
+        if events:
+            self.owner_events[(class_name, handle)] = events
+
+
+    def _remove(self, class_name, handle):
+        """
+        Remove the event references of a person or family.
+        """
+        for event_handle in self.owner_events.pop((class_name, handle), ()):
+            remaining = [p for p in self.participants[event_handle]
+                         if p[0] != class_name or p[1] != handle]
+            if remaining:
+                self.participants[event_handle] = remaining
+            else:
+                del self.participants[event_handle]
+
+
+    def _update(self, class_name, handle_list, get_object):
+        """
+        Re-index the given people or families.
+        """
+        if self.participants is None:
+            return
+        for handle in handle_list:
+            self._remove(class_name, handle)
+            obj = get_object(handle)
+            if obj:
+                self._add(class_name, obj)
+
+
+    def people_changed(self, handle_list):
+        self._update('Person', handle_list, self.db.get_person_from_handle)
+
+
+    def people_deleted(self, handle_list):
+        self._update('Person', handle_list, lambda handle: None)
+
+
+    def families_changed(self, handle_list):
+        self._update('Family', handle_list, self.db.get_family_from_handle)
+
+
+    def families_deleted(self, handle_list):
+        self._update('Family', handle_list, lambda handle: None)
+
+
+    def rebuild(self):
+        """
+        Start again on next use.
+        """
+        self.participants = None
+        self.owner_events = None
+
+
+    def get_participants(self, event_handle):
+        """
+        Return the participants of the event.
+        """
+        if self.participants is None:
+            self._build()
+        return list(self.participants.get(event_handle, ()))
@@ -0,0 +1,111 @@
+# WikiTree - WikiTree Integration
+#
+# Copyright (C) 2021  Hans Boldt
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+"""
+Memoized full place names.
+"""
+
+# Other gramplet modules
+from dbcache import DbSignalCache
+
+
+
+#====================================================
+#
+# Class PlaceNameCache
+#
+#====================================================
+
+class PlaceNameCache(DbSignalCache):
+    """
+    Full place names ("parish, county, country"), keyed by place handle.
+
+    The chain of enclosing places is memoized for every place on it, so
+    each place is read from the database once. Since a change to one
+    place changes the full name of every place it encloses, the cache
+    is cleared on any place change.
+    """
+
+    SIGNALS = {'place-update': 'places_changed',
+               'place-delete': 'places_changed',
+               'place-rebuild': 'rebuild'}
+
+
+    def __init__(self, db):
+        """
+        Initialize cache
+        """
+        super().__init__(db)
+        self.chains = dict()
+        self.names = dict()
+
+
+    def places_changed(self, handle_list):
+        """
+        Places were updated or deleted.
+        """
+        self.rebuild()
+
+
+    def rebuild(self):
+        """
+        Clear the cache.
+        """
+        self.chains = dict()
+        self.names = dict()
+
+
+    def get_chain(self, place_handle):
+        """
+        Return the handles of the place and its enclosing places, from
+        the innermost out.
+        """
+        chain = self.chains.get(place_handle)
+        if chain is not None:
+            return chain
+
+        # Walk up to the first place already known
+        walked = list()
+        tail = ()
+        handle = place_handle
+        while handle:
+            if handle in self.chains:
+                tail = self.chains[handle]
+                break
+            if handle in walked:
+                # Place enclosed by itself
+                break
+            place = self.db.get_place_from_handle(handle)
+            walked.append(handle)
+            self.names[handle] = place.name.get_value()
+            placeref_list = place.get_placeref_list()
+            handle = placeref_list[0].ref if placeref_list else None
+
+        # Memoize the chain of every place walked
+        for handle in reversed(walked):
+            tail = (handle,) + tail
+            self.chains[handle] = tail
+        return self.chains[place_handle]
+
+
+    def get_full_name(self, place_handle):
+        """
+        Return the full name of the place.
+        """
+        return ', '.join(self.names[handle]
+                         for handle in self.get_chain(place_handle))
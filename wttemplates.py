@@ -0,0 +1,173 @@
+# WikiTree - WikiTree Integration
+#
+# Copyright (C) 2021  Hans Boldt
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+"""
+Registry of the biography templates stored as notes.
+
+The template, header and footer are notes of type 'WikiTree Template',
+'WikiTree Header' and 'WikiTree Footer'.
+"""
+
+#-------------------#
+# Python modules    #
+#-------------------#
+from collections import namedtuple
+import re
+
+# Other gramplet modules
+from dbcache import DbSignalCache
+
+
+default_template = """==Biography==
+
+%(title)s
+
+%(summary)s
+
+%(names)s
+
+%(events)s
+
+%(notes)s
+
+%(pedigree)s
+
+==Sources==
+
+%(sources)s
+
+Last update: %(lastupdate)s
+
+Biography generated by Gramps gramplet WikiTree v0.1.0 at %(timestamp)s
+"""
+
+TEMPLATE_NOTE_TYPES = {'WikiTree Template': 'template',
+                       'WikiTree Header': 'header',
+                       'WikiTree Footer': 'footer'}
+
+FIELD_RE = re.compile(r'%\((\w+)\)s')
+
+
+# template, header, footer: text; fields: set of names used in template
+BioTemplate = namedtuple('BioTemplate', 'template header footer fields')
+
+
+
+#====================================================
+#
+# Class TemplateRegistry
+#
+#====================================================
+
+class TemplateRegistry(DbSignalCache):
+    """
+    The biography template, header and footer notes of a database.
+
+    The notes are located with one scan of the notes on first use, and
+    kept up to date from the note signals.
+    """
+
+    SIGNALS = {'note-add': 'notes_changed',
+               'note-update': 'notes_changed',
+               'note-delete': 'notes_deleted',
+               'note-rebuild': 'rebuild'}
+
+
+    def __init__(self, db):
+        """
+        Initialize registry
+        """
+        super().__init__(db)
+        self.notes = None
+        self.template = None
+
+
+    def _scan(self):
+        """
+        Scan all notes for the template notes.
+        """
+        self.notes = dict()
+        for note in self.db.iter_notes():
+            self._add(note)
+
+
+    def _add(self, note):
+        """
+        Register the note if it is a template note.
+        """
+        kind = TEMPLATE_NOTE_TYPES.get(note.get_type().string)
+        if kind:
+            self.notes[kind] = (note.get_handle(), str(note.text))
+        return kind
+
+
+    def _handles(self):
+        """
+        Handles of the registered notes.
+        """
+        return {handle for handle, text in self.notes.values()}
+
+
+    def notes_changed(self, handle_list):
+        """
+        Notes were added or updated.
+        """
+        if self.notes is None:
+            return
+        ours = self._handles()
+        for handle in handle_list:
+            note = self.db.get_note_from_handle(handle)
+            if note and self._add(note):
+                self.template = None
+            elif handle in ours:
+                # No longer a template note: another may take its place
+                self.rebuild()
+                return
+
+
+    def notes_deleted(self, handle_list):
+        """
+        Notes were deleted.
+        """
+        if self.notes is None:
+            return
+        if self._handles().intersection(handle_list):
+            self.rebuild()
+
+
+    def rebuild(self):
+        """
+        Scan the notes again on next use.
+        """
+        self.notes = None
+        self.template = None
+
+
+    def get_template(self):
+        """
+        Return the BioTemplate for the database.
+        """
+        if self.template is None:
+            if self.notes is None:
+                self._scan()
+            template = self.notes.get('template', (None, default_template))[1]
+            header = self.notes.get('header', (None, ''))[1]
+            footer = self.notes.get('footer', (None, ''))[1]
+            self.template = BioTemplate(template, header, footer,
+                                        frozenset(FIELD_RE.findall(template)))
+        return self.template